@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import resource
+import tempfile
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+from cache import ResponseCache
+from model import ARTICLE_FIELDS, ENRICHMENT_FIELDS, enrich, load_records
+from scheduler import FingerprintStore
+from snapshot import SnapshotStore
+from writeback import WriteBehindTable
+
+# replays the bundled csv through every stage against in-process stand-ins for ollama and airtable, so changes to
+# concurrency, caching or batching can be compared run to run without a GPU or network; answers are derived from a
+# hash of the prompt, so two runs of the same code make exactly the same calls
+
+LABELS = (
+    ('Low Impact', 'Medium Impact', 'High Impact'),
+    ('software', 'hardware', 'nanotech', 'biotech', 'climate/energy', 'other'),
+    ('quantity of life', 'quality of life', 'both', 'neither'),
+    ('High', 'Medium', 'Low'),
+)
+FILLER = 'the technology has seen research progress and some commercial use but its social impact remains uneven across regions and industries'.split()
+
+
+def digest(*parts: str) -> int:
+    return int(hashlib.sha256('\0'.join(parts).encode()).hexdigest()[:8], 16)
+
+
+class MockOllama:
+    # latency is a fixed cost per call, plus prefill per KB of prompt, plus decode per generated word
+    def __init__(self, call_ms: float, prefill_ms_per_kb: float, decode_ms_per_token: float, disagreement: float, ramble: float = 0):
+        self.call_ms = call_ms
+        self.prefill_ms_per_kb = prefill_ms_per_kb
+        self.decode_ms_per_token = decode_ms_per_token
+        self.disagreement = disagreement
+        self.ramble = ramble
+        self.calls = 0
+        self.prompt_bytes = 0
+        self.models: set[str] = set()
+        self._lock = threading.Lock()
+
+    def create(self, model: str, modelfile: str, stream: bool = False) -> dict[str, Any]:
+        with self._lock:
+            self.models.add(model)
+        return {'status': 'success'}
+
+    def generate(self, model: str, prompt: str, stream: bool = False, format: str = '', options: Optional[dict[str, Any]] = None) -> Any:
+        size = len(prompt.encode())
+        with self._lock:
+            self.calls += 1
+            self.prompt_bytes += size
+        answer = self._answer(model, prompt, format)
+        # the server stops at a stop sequence without returning it
+        for stop in (options or {}).get('stop') or ():
+            answer = answer.split(stop)[0]
+        # a word with the whitespace before it stands in for a token
+        tokens = re.findall(r'\s*\S+', answer)[:(options or {}).get('num_predict') or None]
+        time.sleep((self.call_ms + self.prefill_ms_per_kb * size / 1024) / 1000)
+        metadata = {'done': True, 'prompt_eval_count': size // 4, 'eval_count': len(tokens), 'prompt_eval_duration': int(self.prefill_ms_per_kb * size / 1024 * 1e6), 'eval_duration': int(self.decode_ms_per_token * len(tokens) * 1e6)}
+        if stream:
+            return self._stream(tokens, metadata)
+        time.sleep(self.decode_ms_per_token * len(tokens) / 1000)
+        return {**metadata, 'response': ''.join(tokens)}
+
+    def _stream(self, tokens: list[str], metadata: dict[str, Any]) -> Iterator[dict[str, Any]]:
+        for index, token in enumerate(tokens):
+            time.sleep(self.decode_ms_per_token / 1000)
+            yield {'response': token, 'done': False}
+        yield {**metadata, 'response': ''}
+
+    def _answer(self, model: str, prompt: str, format: str) -> str:
+        name = model.split(':')[0]
+        # cheap variants ("general-phi3") sometimes answer differently from the large model, so the cascade escalates
+        (agent, variant) = name.split('-', 1) if '-' in name else (name, '')
+        seed = digest(prompt)
+        if variant and digest(prompt, variant) % 100 < self.disagreement * 100:
+            seed += 1
+        if format == 'json':
+            return json.dumps({section: ' '.join(FILLER[:12]) for section in ('summary', 'impact', 'author', 'opinion')})
+        if agent == 'summarizer':
+            return f'SUMMARY: {" ".join(FILLER[:20])}\nIMPACT: {" ".join(FILLER[:22])}\nAUTHOR: Jane Doe\nOPINION: {" ".join(FILLER[:22])}'
+        # some answers go on after the label, some hedge between two labels instead of picking one
+        ramble = digest(prompt, name, 'ramble') % 100 < self.ramble * 100
+        if '% impact' in prompt:
+            return f'{(seed % 50) / 10:g}%' + (f'\n{" ".join(FILLER[:15])}' if ramble else '')
+        for labels in LABELS:
+            if all(f'"{label.lower()}"' in prompt.lower() for label in labels):
+                label = labels[seed % len(labels)]
+                if not ramble:
+                    return label
+                if seed % 3 == 0:
+                    return f'{label} to {labels[(seed + 1) % len(labels)]}'
+                return f'{label}\n{" ".join(FILLER[:15])}'
+        words = [FILLER[(seed + index) % len(FILLER)] for index in range(60 + seed % 40)]
+        if 'Respond in the following format' in prompt:
+            return f'{1 + seed % 6}. ' + ' '.join(words)
+        return ' '.join(words)
+
+    # defined last: inside the class body the name shadows the builtin used in the annotations above
+    def list(self) -> dict[str, Any]:
+        with self._lock:
+            return {'models': [{'name': name} for name in sorted(self.models)]}
+
+
+class MockTable:
+    def __init__(self, records: list[dict[str, Any]], request_ms: float):
+        self.records = records
+        self.request_ms = request_ms
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def all(self, **options: Any) -> list[dict[str, Any]]:
+        self._request()
+        return list(self.records)
+
+    def batch_update(self, records: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        if len(records) > 10:
+            raise ValueError('airtable accepts at most 10 records per request')
+        self._request()
+        return records
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.request_ms / 1000)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        source = SnapshotStore(os.path.join(directory, 'source.sqlite'), ARTICLE_FIELDS)
+        source.load_csv(args.csv)
+        # only the article itself, so every record goes through every stage (the csv also has a type column)
+        records = [{**record, 'fields': {field: value for field, value in record['fields'].items() if field in ARTICLE_FIELDS}} for record in source.all()[:args.records]]
+        table = MockTable(records, args.airtable_ms)
+        source.close()
+
+        store = SnapshotStore(os.path.join(directory, 'snapshot.sqlite'), ARTICLE_FIELDS + ENRICHMENT_FIELDS, indexed=ENRICHMENT_FIELDS)
+        store.sync(table, source='benchmark')
+        writer = WriteBehindTable(table, os.path.join(directory, 'journal.jsonl'), rate=args.airtable_rate)
+        client = MockOllama(args.call_ms, args.prefill_ms_per_kb, args.decode_ms_per_token, args.disagreement, args.ramble)
+        cache = ResponseCache(args.cache) if args.cache else None
+        technologies = {record.id: record.technology for record in load_records(store)}
+
+        def commit(record_id: str, stage: str, fields: dict[str, Any]):
+            store.update(record_id, fields)
+            writer.update(record_id, fields)
+
+        start = time.perf_counter()
+        fingerprints = FingerprintStore(os.path.join(directory, 'fingerprints.sqlite'))
+        (scheduler, usage, routing) = enrich(technologies, client, 1, cache, fingerprints, commit)
+        writer.close()
+        seconds = time.perf_counter() - start
+        store.close()
+        fingerprints.close()
+        if cache is not None:
+            cache.close()
+
+    records = len(technologies)
+    return {
+        'records': records,
+        'seconds': seconds,
+        'records_per_minute': records / seconds * 60,
+        'llm_calls_per_record': client.calls / records,
+        'prompt_bytes_per_record': client.prompt_bytes / records,
+        'airtable_requests': table.requests,
+        # ru_maxrss is in kilobytes on linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': {stage: {'p50': percentile(durations, 0.5), 'p95': percentile(durations, 0.95)} for stage, durations in scheduler.timings.stages().items()},
+        'reports': [scheduler.report(), usage.report(), routing.report()],
+    }
+
+
+def report(result: dict[str, Any], baseline: Optional[dict[str, Any]]):
+    def line(label: str, value: float, unit: str, old: Optional[float]):
+        change = f'  ({(value - old) / old:+.0%} vs baseline {old:.2f})' if old else ''
+        print(f'{label:<28} {value:10.2f} {unit}{change}')
+
+    old = baseline or {}
+    print(f'{result["records"]} records in {result["seconds"]:.1f}s')
+    for (label, key, unit) in (('records/min', 'records_per_minute', ''), ('llm calls per record', 'llm_calls_per_record', ''), ('prompt bytes per record', 'prompt_bytes_per_record', 'B'), ('airtable requests', 'airtable_requests', ''), ('peak rss', 'peak_rss_mb', 'MB')):
+        line(label, result[key], unit, old.get(key))
+    print('stage latency (s):')
+    for stage, latency in sorted(result['stages'].items()):
+        before = old.get('stages', {}).get(stage, {})
+        line(f'  {stage} p50', latency['p50'], 's', before.get('p50'))
+        line(f'  {stage} p95', latency['p95'], 's', before.get('p95'))
+    for text in result['reports']:
+        print(text)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', default=os.path.join(os.path.dirname(__file__), 'breakthrough_technologies.csv'))
+    parser.add_argument('--records', type=int, default=None, help='replay only the first N records')
+    parser.add_argument('--call-ms', type=float, default=5)
+    parser.add_argument('--prefill-ms-per-kb', type=float, default=2)
+    parser.add_argument('--decode-ms-per-token', type=float, default=0.5)
+    parser.add_argument('--disagreement', type=float, default=0.3, help='how often a cheap model gives a different label')
+    parser.add_argument('--ramble', type=float, default=0.2, help='how often an answer goes on past the label or hedges between two')
+    parser.add_argument('--airtable-ms', type=float, default=20)
+    parser.add_argument('--airtable-rate', type=float, default=5)
+    parser.add_argument('--cache', help='response cache to use; left off by default so every call is paid for')
+    parser.add_argument('--baseline', default=os.path.join(os.path.dirname(__file__), '.benchmark_baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline to compare later runs against')
+    args = parser.parse_args()
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    result = run(args)
+    report(result, baseline)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({key: value for key, value in result.items() if key != 'reports'}, file, indent=2)
+        print('saved baseline to', args.baseline)
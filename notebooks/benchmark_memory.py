@@ -0,0 +1,59 @@
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+from typing import Any, Callable
+
+from model import ARTICLE_FIELDS, ENRICHMENT_FIELDS, SNAPSHOT, load_records
+from snapshot import SnapshotStore
+
+# compares the memory held by the records of the whole dataset before and after Technology moved to slots and
+# lazily loaded text fields; measured with tracemalloc, since the process's resident size never shrinks back after
+# the first variant and so can't be compared within one run
+
+
+class DictTechnology:
+    # Technology as it was: one instance __dict__ per record holding every field, text included
+    def __init__(self, fields: dict[str, Any]):
+        name = fields.get('name')
+        if name is not None:
+            self.name = fields['name']
+            self.year = fields['year']
+            self.tr_text = fields['tr_text']
+            for field in ENRICHMENT_FIELDS:
+                setattr(self, field, fields.get(field))
+
+
+class DictRecord:
+    def __init__(self, record: dict[str, Any]):
+        self.id: str = record['id']
+        self.technology = DictTechnology(record['fields'])
+        self.createdTime = record['createdTime']
+
+
+def measure(label: str, load: Callable[[SnapshotStore], list[Any]], store: SnapshotStore):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = load(store)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f'{label:<8} records={len(records):<6} held={held / 1024:9.1f} KB  per record={held / len(records):8.0f} B')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--snapshot', default=SNAPSHOT, help='snapshot store to load; seeded from --csv when it does not exist')
+    parser.add_argument('--csv', default=os.path.join(os.path.dirname(__file__), 'breakthrough_technologies.csv'))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.snapshot if os.path.exists(args.snapshot) else os.path.join(directory, 'snapshot.sqlite')
+        store = SnapshotStore(path, ARTICLE_FIELDS + ENRICHMENT_FIELDS)
+        if store.count() == 0:
+            print('seeded snapshot with', store.load_csv(args.csv), 'records from', args.csv)
+        measure('before', lambda store: [DictRecord(record) for record in store.all()], store)
+        measure('after', load_records, store)
+        store.close()
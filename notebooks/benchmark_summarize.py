@@ -0,0 +1,63 @@
+import argparse
+import csv
+import os
+import time
+from typing import Any
+
+import ollama
+
+from model import Agent, AgentInfo, Technology, provision_agents, summarize
+from scheduler import ModelLimiter, Usage
+
+# compares the summary stage before and after single-pass extraction against a live ollama server, on the
+# records bundled in breakthrough_technologies.csv; the response cache is left off so every call is paid for.
+# --offline swaps the server for benchmark.MockOllama, whose token counts are estimates (a token per 4 bytes)
+
+
+def summarize_with_cleaner(technology: Technology, summarizer: Agent, cleaner: Agent) -> tuple[str, str, str, str]:
+    extractions = technology.summarize(summarizer)
+    summary = cleaner.run(f'Do not add any text of your own, and ignore the "IMPACT:", "AUTHOR:" and "OPINION:" sections. Just return the "SUMMARY:" text verbatim from following text: "{extractions}"')
+    impact = cleaner.run(f'Do not add any text of your own, and ignore the "SUMMARY:", "AUTHOR:" and "OPINION:" sections. Just return the "IMPACT:" text verbatim from following text: "{extractions}"')
+    author = cleaner.run(f'Do not add any text of your own, and ignore the "SUMMARY:", "IMPACT:" and "OPINION:" sections. Just return the "AUTHOR:" text verbatim from following text: "{extractions}"')
+    opinion = cleaner.run(f'Do not add any text of your own, and ignore the "SUMMARY:", "IMPACT:" and "AUTHOR:" sections. Just return the "OPINION:" text verbatim from following text: "{extractions}"')
+    return (summary, impact, author, opinion)
+
+
+def technologies(path: str, limit: int) -> list[Technology]:
+    with open(path, newline='') as file:
+        rows = csv.DictReader(file)
+        return [Technology({'name': row['name'], 'year': row['year'], 'tr_text': row['blurb']}) for row, _ in zip(rows, range(limit))]
+
+
+def measure(label: str, summarize, technologies: list[Technology], client: Any):
+    limiter = ModelLimiter({})
+    usage = Usage()
+    summarizer = Agent(AgentInfo.summarizer, limiter, usage=usage, client=client)
+    cleaner = Agent(AgentInfo.cleaner, limiter, usage=usage, client=client)
+    provision_agents(client, [summarizer, cleaner])
+    start = time.perf_counter()
+    for technology in technologies:
+        summarize(technology, summarizer=summarizer, cleaner=cleaner)
+    seconds = time.perf_counter() - start
+
+    totals = usage.totals().values()
+    per_record = lambda counter: sum(total[counter] for total in totals) / len(technologies)
+    print(f'{label:<8} calls={per_record("calls"):4.1f}  prompt tokens={per_record("prompt_eval_count"):7.0f}  eval tokens={per_record("eval_count"):6.0f}  seconds={seconds / len(technologies):6.1f}  (per record)')
+    print(usage.report())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=5)
+    parser.add_argument('--csv', default=os.path.join(os.path.dirname(__file__), 'breakthrough_technologies.csv'))
+    parser.add_argument('--offline', action='store_true', help='run against the mock server from benchmark.py instead of ollama')
+    args = parser.parse_args()
+
+    if args.offline:
+        from benchmark import MockOllama
+        client = MockOllama(call_ms=5, prefill_ms_per_kb=2, decode_ms_per_token=0.5, disagreement=0)
+    else:
+        client = ollama
+    sample = technologies(args.csv, args.records)
+    measure('before', summarize_with_cleaner, sample, client)
+    measure('after', summarize, sample, client)
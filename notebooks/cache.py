@@ -0,0 +1,60 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+
+class ResponseCache:
+    # generations are deterministic for a given modelfile (fixed seed and temperature), so a response can be
+    # reused whenever the base model, the rendered modelfile and the prompt are all unchanged
+    def __init__(self, path: str, max_entries: int = 100_000, max_age_days: float = 90, bypass: bool = False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.evict()
+
+    @staticmethod
+    def key(model: str, modelfile: str, prompt: str, **options: Any) -> str:
+        return hashlib.sha256(json.dumps([model, modelfile, prompt, options], sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = None if self.bypass else self._db.execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or time.time() - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def set(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)', (key, response, now, now))
+            self._db.commit()
+
+    def evict(self):
+        with self._lock:
+            self._db.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.max_age,))
+            self._db.execute('DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)', (self.max_entries,))
+            self._db.commit()
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0
+        return f'llm cache: {self.hits} hits, {self.misses} misses ({rate:.0%} hit rate){" [bypassed]" if self.bypass else ""}'
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,11 +1,24 @@
 
+import json
+import os
+import re
 import time
 from enum import Enum
-from typing import Any, Optional
+from functools import lru_cache, partial
+from typing import Any, Callable, Iterable, Optional
 
 import ollama
+from dotenv import load_dotenv
 from pyairtable import Api
 
+from cache import ResponseCache
+from pool import OllamaPool
+from provision import provision, tagged
+from router import CascadeRouter, Label, Percentage, RoutingStats
+from scheduler import FingerprintStore, ModelLimiter, Pipeline, Scheduler, Stage, Usage, current_stage
+from snapshot import SnapshotStore
+from writeback import WriteBehindTable
+
 gates_article = '''
 I was honored when MIT Technology Review invited me to be the first guest curator of its 10 Breakthrough Technologies. Narrowing down the list was difficult. I wanted to choose things that not only will create headlines in 2019 but captured this moment in technological history—which got me thinking about how innovation has evolved over time.
 
@@ -45,23 +58,45 @@ class AgentInfo(Enum):
     optimist = 'optimist'
     pessimist = 'pessimist'
     social_benefits = 'social_benefits'
+    # the same agents with the Bill Gates article in their system prompt, so it is part of a prefix every call
+    # shares and the server can reuse its KV cache instead of prefilling the article again for each record
+    general_gates = 'general_gates'
+    social_benefits_gates = 'social_benefits_gates'
 
-    def modelfile(self) -> str:
+    def modelfile(self, model: Optional[Model] = None) -> str:
         return f'''
-            FROM {Model.llama31.value}
+            FROM {(model or self.base_model()).value}
             SYSTEM """{self._system_prompt()}"""
             PARAMETER temperature 0.3
             PARAMETER num_ctx 8192
             PARAMETER seed 42
         '''
 
-    def modelname(self) -> str:
-        return self.value
+    def base_model(self) -> Model:
+        return Model.llama31
+
+    def modelname(self, model: Optional[Model] = None) -> str:
+        if model is None or model == self.base_model():
+            return self.value
+        return f'{self.value}-{model.name}'
+
+    def has_gates_article(self) -> bool:
+        return self in (AgentInfo.general_gates, AgentInfo.social_benefits_gates)
     
     def _system_prompt(self) -> str:
         general = 'You are an expert in technology, economics, and social well-being, and are an editor for the MIT Technology Review. You are critical and discerning, with an eye for scientific accuracy. Make no reference to the prompt when providing your responses. Provide your responses directly without commentary.'
         match self:
             case AgentInfo.general: return general
+            case AgentInfo.general_gates: return f'''
+                {AgentInfo.general._system_prompt()}
+
+                {self._gates_context()}
+                '''
+            case AgentInfo.social_benefits_gates: return f'''
+                {AgentInfo.social_benefits._system_prompt()}
+
+                {self._gates_context()}
+                '''
             case AgentInfo.summarizer: return f'''
                 {general}
 
@@ -104,62 +139,140 @@ class AgentInfo(Enum):
                 
                 Keep your response to under 100 words. Do not provide any commentary or give any introduction to the response, just give the response. Be terse and direct with your sentences in order to fit more information into the response.
                 '''
-class Agent:
 
-    def __init__(self, info: AgentInfo):
-        self.modelName = self.create(name= info.modelname(),  modelfile = info.modelfile())
-        print(self.modelName)
+    def _gates_context(self) -> str:
+        return f'''Some prompts will refer to the following article by Bill Gates on the MIT Technology Review (TR) Breakthrough Technology picks, which discusses "quantity of life" and "quality of life" as different ways technology can be impactful and gives his opinion on a way to measure the success of a technology: "{gates_article}"'''
+class Agent:
 
-    def create(self, name: str, modelfile: str) -> Optional[str]:
-        response = ollama.create(model=name, modelfile=modelfile, stream=False)
-        if response["status"] == "success":
-            return name
-        else:
-            return None
+    def __init__(self, info: AgentInfo, limiter: ModelLimiter, cache: Optional[ResponseCache] = None, usage: Optional[Usage] = None, model: Optional[Model] = None, client: Any = ollama):
+        self.info = info
+        # the ollama module itself talks to one local server, an OllamaPool to several
+        self.client = client
+        self.model = model or info.base_model()
+        self.limiter = limiter
+        self.cache = cache
+        self.usage = usage
+        self.modelfile = info.modelfile(self.model)
+        # created on the server by provision_agents() before any agent runs
+        self.modelName = tagged(info.modelname(self.model), self.modelfile)
     
-    def run(self, prompt: str) -> str:
-        return ollama.generate(model=self.modelName, prompt=prompt)["response"].strip()
-
+    def run(self, prompt: str, parser: Optional[Any] = None) -> str:
+        # with a parser (router.Label, router.Percentage) the answer is streamed and cut off once it has been given
+        return self._generate(prompt, parser=parser)
+
+    def run_json(self, prompt: str) -> dict[str, Any]:
+        return json.loads(self._generate(prompt, format='json'))
+
+    def _generate(self, prompt: str, parser: Optional[Any] = None, **options: Any) -> str:
+        if parser is not None:
+            options['options'] = {'num_predict': parser.num_predict, 'stop': list(parser.stop)}
+        key = ResponseCache.key(self.model.value, self.modelfile, prompt, **options)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        with self.limiter.slot(self.model.value):
+            if parser is None:
+                response = self.client.generate(model=self.modelName, prompt=prompt, **options)
+            else:
+                response = self._stream(prompt, parser, **options)
+        if self.usage is not None:
+            self.usage.add(current_stage() or self.info.value, response)
+        text = response["response"].strip()
+        if self.cache is not None:
+            self.cache.set(key, text)
+        return text
+
+    def _stream(self, prompt: str, parser: Any, **options: Any) -> dict[str, Any]:
+        start = time.perf_counter()
+        first_token = None
+        text = ''
+        tokens = 0
+        final: dict[str, Any] = {}
+        chunks = self.client.generate(model=self.modelName, prompt=prompt, stream=True, **options)
+        try:
+            for chunk in chunks:
+                if chunk['response']:
+                    first_token = first_token or time.perf_counter()
+                    tokens += 1
+                    text += chunk['response']
+                if chunk.get('done'):
+                    final = chunk
+                    break
+                # only an answer that is complete on its own line or sentence, so "Medium-High" isn't cut at "Medium"
+                if parser.final(text) is not None:
+                    break
+        finally:
+            # hanging up is what stops the server generating
+            chunks.close()
+        end = time.perf_counter()
+        # a stream hung up on never gets the server's token counts, so Usage leaves cut short calls out of those
+        return {**final, 'response': text, 'streams': 1, 'cut_short': 0 if final else 1, 'first_token_seconds': (first_token or end) - start, 'stream_tokens': tokens, 'stream_seconds': end - (first_token or end)}
+
+
+
+def provision_agents(client: Any, agents: Iterable[Agent]):
+    start = time.perf_counter()
+    created = provision(client, {agent.modelName: agent.modelfile for agent in agents})
+    print(f'provisioned agents in {time.perf_counter() - start:.1f}s, created: {", ".join(created) or "none"}')
+
+
+
+ARTICLE_FIELDS = ('name', 'year', 'link', 'specific_link', 'tr_text')
+ENRICHMENT_FIELDS = ('summary', 'impact', 'author', 'opinion', 'impact_level', 'optimist', 'pessimist', 'social_impact', 'social_impact_level', 'social_impact_potential', 'social_impact_potential_level', 'type', 'spi_impact', 'quant_qual', 'flop_type')
+# the fields that run to paragraphs; everything else is a name, a year or a label
+TEXT_FIELDS = ('tr_text', 'summary', 'impact', 'opinion', 'optimist', 'pessimist', 'social_impact', 'social_impact_potential')
 
 
 class Record:
-    def __init__(self, record):
+    __slots__ = ('id', 'technology', 'createdTime')
+
+    def __init__(self, record: dict[str, Any], loader: Optional[Callable[[str], Any]] = None):
         self.id: str = record['id']
-        self.technology = Technology(record['fields'])
-        self.createdTime = record['createdTime']
+        self.technology = Technology(record['fields'], loader)
+        self.createdTime: Optional[str] = record['createdTime']
 
     def __repr__(self):
-        return f"{self.fields}"
-
-
-
-class Technology: 
-    def __init__(self, fields: dict[str, Any]):
-        name = fields.get('name')
-        if name is not None:
-            self.name = fields['name']
-            self.year = fields['year']
-            # self.link = fields['link']
-            # self.specific_link = fields['specific_link']
-            self.tr_text = fields['tr_text']
-            self.summary = fields.get('summary')
-            self.impact = fields.get('impact')
-            self.author = fields.get('author')
-            self.opinion = fields.get('opinion')
-            self.impact_level = fields.get('impact_level')
-            self.optimist = fields.get('optimist')
-            self.pessimist = fields.get('pessimist')
-            self.social_impact = fields.get('social_impact')
-            self.social_impact_level = fields.get('social_impact_level')
-            self.social_impact_potential = fields.get('social_impact_potential')
-            self.social_impact_potential_level = fields.get('social_impact_potential_level')
-            self.type = fields.get('type')
-            self.spi_impact = fields.get('spi_impact')
-            self.quant_qual = fields.get('quant_qual')
-            self.flop_type = fields.get('flop_type')
+        return f'Record({self.id!r}, {self.technology.name!r})'
+
+
+class Technology:
+    # slots instead of an instance __dict__; given a loader, text fields that weren't passed in are left unset and
+    # read through it by whichever stage asks for them, so they aren't kept in memory for the whole run (which is
+    # also why this isn't a dataclass: its __init__ would assign every field)
+    __slots__ = ('name', 'year', *ENRICHMENT_FIELDS, 'tr_text', '_loader')
+
+    name: Optional[str]
+    year: Optional[int]
+    tr_text: Optional[str]
+    summary: Optional[str]
+    impact: Optional[str]
+    author: Optional[str]
+    opinion: Optional[str]
+    impact_level: Optional[str]
+    optimist: Optional[str]
+    pessimist: Optional[str]
+    social_impact: Optional[str]
+    social_impact_level: Optional[str]
+    social_impact_potential: Optional[str]
+    social_impact_potential_level: Optional[str]
+    type: Optional[str]
+    spi_impact: Optional[str]
+    quant_qual: Optional[str]
+    flop_type: Optional[str]
+
+    def __init__(self, fields: dict[str, Any], loader: Optional[Callable[[str], Any]] = None):
+        self._loader = loader
+        for field in ('name', 'year', 'tr_text', *ENRICHMENT_FIELDS):
+            if field in fields or loader is None or field not in TEXT_FIELDS:
+                setattr(self, field, fields.get(field))
+
+    def __getattr__(self, field: str) -> Any:
+        # only reached for a slot that was never set
+        if field not in TEXT_FIELDS:
+            raise AttributeError(field)
+        return self._loader(field)
 
-
-    
     def summarize(self, agent: Agent) -> str:
         summary = agent.run(f'''Here is the article to summarize about {self.name} from the year {self.year}: "{self.tr_text}"''')
         return summary
@@ -167,104 +280,51 @@ class Technology:
     def fulfillment(self, agent: Agent) -> str:
         return agent.run(f'''Given the following description of the technology "{self.name}" and its impact since the year {self.year}, pick one of the following words to describe its success "Low Impact", "Medium Impact", "High Impact". Only return one of those, do not provide any other commentary. Here is the description to use for your decision: "{self.tr_text}"''')
 
+    def opinion_of(self, agent: Agent) -> str:
+        return agent.run(f'''Given the following description of the technology "{self.name}" and its impact since the year {self.year}, provide your opinion on the technology and its impact. Do not provide any other commentary. Here is the description to use for your opinion: "{self.tr_text}"''')
 
-def summarize(technology: Technology, summarizer: Agent, cleaner: Agent) -> tuple[str, str, str, str]:
-        extractions = technology.summarize(summarizer)
-        summary = cleaner.run(f'Do not add any text of your own, and ignore the "IMPACT:", "AUTHOR:" and "OPINION:" sections. Just return the "SUMMARY:" text verbatim from following text: "{extractions}"')
-        impact = cleaner.run(f'Do not add any text of your own, and ignore the "SUMMARY:", "AUTHOR:" and "OPINION:" sections. Just return the "IMPACT:" text verbatim from following text: "{extractions}"')
-        author = cleaner.run(f'Do not add any text of your own, and ignore the "SUMMARY:", "IMPACT:" and "OPINION:" sections. Just return the "AUTHOR:" text verbatim from following text: "{extractions}"')
-        opinion = cleaner.run(f'Do not add any text of your own, and ignore the "SUMMARY:", "IMPACT:" and "AUTHOR:" sections. Just return the "OPINION:" text verbatim from following text: "{extractions}"')
-        return (summary, impact, author, opinion)
-
-
-
-
-import os
-
-from dotenv import load_dotenv
-
-load_dotenv()
-token = os.getenv('AIRTABLE_TOKEN') # get your token from online and then put it into the .env file as "AIRTABLE_TOKEN=your_token_here"
-api = Api(api_key=token)
-table = api.table('appOHJEmEMgO9CV6X', 'tblPEUr3QOpPlxIYY')
-
-
-records = list(map(lambda record: Record(record), table.all()))
-
-general = Agent(AgentInfo.general)
-summarizer = Agent(AgentInfo.summarizer)
-cleaner = Agent(AgentInfo.cleaner)
-optimist = Agent(AgentInfo.optimist)
-pessimist = Agent(AgentInfo.pessimist)
-social_benefits = Agent(AgentInfo.social_benefits)
-
-for record in records:
-    start_time = time.time()
-    tech = record.technology
-    if tech.author is None:
-        (summary, impact, author, opinion) = summarize(tech, summarizer=summarizer, cleaner=cleaner)
-        response = table.update(record.id, {'summary': summary, 'impact': impact, 'author': author, 'opinion': opinion})
-    elif tech.author.startswith('AUTHOR:'):
-        author = tech.author[7:].strip()
-        response = table.update(record.id, {'author': author})
-
-    if tech.impact_level is None:
-        impact_level = tech.fulfillment(general)
-        response = table.update(record.id, {'impact_level': impact_level})
-
-    if tech.optimist is None:
-        optimist_response = optimist.run(f'''Given the following description of the technology "{tech.name}" and its impact since the year {tech.year}, provide your opinion on the technology and its impact. Do not provide any other commentary. Here is the description to use for your opinion: "{tech.tr_text}"''')
-        response = table.update(record.id, {'optimist': optimist_response})
-
-    if tech.pessimist is None:
-        pessimist_response = pessimist.run(f'''Given the following description of the technology "{tech.name}" and its impact since the year {tech.year}, provide your opinion on the technology and its impact. Do not provide any other commentary. Here is the description to use for your opinion: "{tech.tr_text}"''')
-        response = table.update(record.id, {'pessimist': pessimist_response})
-
-    if tech.type is None:
-        type = general.run(f'''Pick one of "software", "hardware", "nanotech", "biotech", "climate/energy", or "other" to describe the type of technology "{tech.name}" is. 
+    def classify_type(self, agent: Agent) -> str:
+        return agent.run(f'''Pick one of "software", "hardware", "nanotech", "biotech", "climate/energy", or "other" to describe the type of technology "{self.name}" is. 
                             "Hardware" includes headphones, keyboards, pens, computer chips, etc.
                             "Software" includes encryption, user interfaces, etc. 
                            "Nanotech" includes quantum wires, nanopiezoelectronics, etc. 
                            "Biotech" includes gene therapy, drugs, etc.  
                            "Climate/Energy" includes carbon capture, solar panels, fusion reactors etc.
-                           Do not provide any other commentary, just return one of those five words. Here is the description to help you decide on a type for this technology: "{tech.tr_text}"''')
-        response = table.update(record.id, {'type': type})
-        print('updated type for', tech.name, 'to', type)
-
-    if tech.spi_impact is None:
-        if tech.social_impact is None:
-            social_response = social_benefits.run(f'''Given the following description of the technology "{tech.name}" and its impact since the year {tech.year}, provide your opinion on the technology and its impact on social well-being and people's lives. Do not provide any other commentary. While you can consider all types of impacts, including potential off-shoot technologies, use only the actual impacts of the technology to make an assessment, do not hypothesize about potential impacts. While you should not use this description to color your assessment, I provide it as further context for you on the technology. This is the description of why the MIT Technology Review thought this technology would be a breakthrough: "{tech.tr_text}"''')
-            social_impact_level = social_benefits.run(f'''Choose one of "High", "Medium", or "Low" to describe the actual social impact level of the technology {tech.name}. Do not provide any additional commentary, simply return one of those three words. Use this assessment of the actual impact to inform your decision: "{social_response}"''')
-
-            social_impact_potential = social_benefits.run(f'''Given the following description of the technology "{tech.name}", provide your opinion on the technology and its potential impact on social well-being and people's lives. Do not provide any other commentary. While you can consider all types of impacts, including potential off-shoot technologies, ignore existing impacts and only hypothesize about potential impacts into the future from today onward. While you should not use this description to color your assessment, I provide it as further context for you on the technology. This is the description of why the MIT Technology Review thought this technology would be a breakthrough: "{tech.tr_text}"''')
-            social_impact_potential_level = social_benefits.run(f'''Choose one of "High", "Medium", or "Low" to describe the potential social impact level of the technology {tech.name}. Do not provide any additional commentary, simply return one of those three words. Use this assessment of the potential impact to inform your decision: "{social_response}"''')
-        else:
-            social_response = tech.social_impact
-            social_impact_potential = tech.social_impact_potential
-            social_impact_level = tech.social_impact_level
-            social_impact_potential_level = tech.social_impact_potential_level
-        
-        if tech.spi_impact is None:
-            spi_impact = social_benefits.run(f'''Given the following commentary on the technology "{tech.name}", provide your best guess at a % impact of this technology on the Social Progress Index since the year {tech.year} and over the next 20 years. 
+                           Do not provide any other commentary, just return one of those five words. Here is the description to help you decide on a type for this technology: "{self.tr_text}"''')
+
+    def social_impact_of(self, agent: Agent) -> str:
+        return agent.run(f'''Given the following description of the technology "{self.name}" and its impact since the year {self.year}, provide your opinion on the technology and its impact on social well-being and people's lives. Do not provide any other commentary. While you can consider all types of impacts, including potential off-shoot technologies, use only the actual impacts of the technology to make an assessment, do not hypothesize about potential impacts. While you should not use this description to color your assessment, I provide it as further context for you on the technology. This is the description of why the MIT Technology Review thought this technology would be a breakthrough: "{self.tr_text}"''')
+
+    def social_impact_level_of(self, classifier: Agent) -> str:
+        return classifier.run(f'''Choose one of "High", "Medium", or "Low" to describe the actual social impact level of the technology {self.name}. Do not provide any additional commentary, simply return one of those three words. Use this assessment of the actual impact to inform your decision: "{self.social_impact}"''')
+
+    def social_impact_potential_of(self, agent: Agent) -> str:
+        return agent.run(f'''Given the following description of the technology "{self.name}", provide your opinion on the technology and its potential impact on social well-being and people's lives. Do not provide any other commentary. While you can consider all types of impacts, including potential off-shoot technologies, ignore existing impacts and only hypothesize about potential impacts into the future from today onward. While you should not use this description to color your assessment, I provide it as further context for you on the technology. This is the description of why the MIT Technology Review thought this technology would be a breakthrough: "{self.tr_text}"''')
+
+    def social_impact_potential_level_of(self, classifier: Agent) -> str:
+        return classifier.run(f'''Choose one of "High", "Medium", or "Low" to describe the potential social impact level of the technology {self.name}. Do not provide any additional commentary, simply return one of those three words. Use this assessment of the potential impact to inform your decision: "{self.social_impact_potential}"''')
+
+    def spi(self, agent: Agent) -> str:
+        return agent.run(f'''Given the following commentary on the technology "{self.name}", provide your best guess at a % impact of this technology on the Social Progress Index since the year {self.year} and over the next 20 years. 
                                         Consider a range of possible % impacts over a single order of magnitude and provide a single number that you think is the most likely. 
-                                        Do not provide any other commentary. Just return a single % number. Remember that 1% means a 1% increase in the Social Progress Index can be attributed SOLELY to {tech.name}. Negative % is also acceptable if the technology impact is expected to reduce the Social Progress Index and negatively impact society. So we expect the number to be small yet precise.
+                                        Do not provide any other commentary. Just return a single % number. Remember that 1% means a 1% increase in the Social Progress Index can be attributed SOLELY to {self.name}. Negative % is also acceptable if the technology impact is expected to reduce the Social Progress Index and negatively impact society. So we expect the number to be small yet precise.
                                         Here is the commentary to use for your decision: 
-                                        "{social_response}"
-                                        "{social_impact_potential}"
+                                        "{self.social_impact}"
+                                        "{self.social_impact_potential}"
                                         ''')
-        else:
-            spi_impact = tech.spi_impact
 
-        response = table.update(record.id, {'social_impact': social_response, 'social_impact_level': social_impact_level, 'social_impact_potential': social_impact_potential, 'social_impact_potential_level': social_impact_potential_level, 'spi_impact': spi_impact})
-        print('updated social for', tech.name)
+    def _gates_article(self, agent: Agent) -> str:
+        if agent.info.has_gates_article():
+            return 'the article by Bill Gates you were given in your instructions'
+        return f'"{gates_article}"'
 
-    if tech.quant_qual is None:
-        quant_qual = social_benefits.run(f'''
-                                 First, read this article by Bill Gates on the MIT Technology Review (TR) Breakthrough Technology picks that discusses "quantity of life" and "quality of life" as different ways technology can be impactful: "{gates_article}"
+    def quality_of_life(self, agent: Agent) -> str:
+        return agent.run(f'''
+                                 First, read this article by Bill Gates on the MIT Technology Review (TR) Breakthrough Technology picks that discusses "quantity of life" and "quality of life" as different ways technology can be impactful: {self._gates_article(agent)}
 
-                                 Next, read this description of a "{tech.name}", a Breakthrough Technology that TR picked in year {tech.year}: "{tech.tr_text}"
+                                 Next, read this description of a "{self.name}", a Breakthrough Technology that TR picked in year {self.year}: "{self.tr_text}"
                                  
-                                 Now, using Bill Gates' article and description pick one of "quantity of life" or "quality of life" or "both" or "neither" to best describe "{tech.name}" impacts on society, humanity, and all living beings.
+                                 Now, using Bill Gates' article and description pick one of "quantity of life" or "quality of life" or "both" or "neither" to best describe "{self.name}" impacts on society, humanity, and all living beings.
 
                                  If there is a negative impact, you can consider whether that negative impact is a "quantity" or "quality" impact.
 
@@ -272,26 +332,23 @@ for record in records:
 
                                 Do not provide any other commentary, just return one of those these four tags: "quantity of life", "quality of life", "both", "neither". 
                                 ''')
-        
-        response = table.update(record.id, {'quant_qual': quant_qual})
-        print('updated quant_qual for', tech.name)
-
-    if tech.flop_type is None:
-        flop_type = general.run(f'''
-                                I'm going to give you a bunch of thoughts about the technology {tech.name}:
-                                The article written by the MIT Technology Review in {tech.year} about why this technology will be a breakthrough: "{tech.tr_text}"
+
+    def flop(self, agent: Agent) -> str:
+        return agent.run(f'''
+                                I'm going to give you a bunch of thoughts about the technology {self.name}:
+                                The article written by the MIT Technology Review in {self.year} about why this technology will be a breakthrough: "{self.tr_text}"
                                 Next, here are some opinions on the social impact that this technology has had and may have in the future.
-                                The actual social impact of the technology: "{tech.social_impact}"
-                                The potential social impact of the technology: "{tech.social_impact_potential}"
-                                The very rough estimation impact on the Social Progress Index: "{tech.spi_impact}"
+                                The actual social impact of the technology: "{self.social_impact}"
+                                The potential social impact of the technology: "{self.social_impact_potential}"
+                                The very rough estimation impact on the Social Progress Index: "{self.spi_impact}"
 
                                 Next, here are some opinions on the technology and whether it is actually a breakthrough.
-                                The optimist's opinion: "{tech.optimist}"
-                                The pessimist's opinion: "{tech.pessimist}"
-                                The general opinion on the impact level of the technology: "{tech.impact}
-                                An opinion on the success of the claim that this technology will be a breakthrough: "{tech.opinion}"   
+                                The optimist's opinion: "{self.optimist}"
+                                The pessimist's opinion: "{self.pessimist}"
+                                The general opinion on the impact level of the technology: "{self.impact}
+                                An opinion on the success of the claim that this technology will be a breakthrough: "{self.opinion}"   
 
-                                Here is a general opinion by Bill Gates' on a way to measure the success of a technology: "{gates_article}"
+                                Here is a general opinion by Bill Gates' on a way to measure the success of a technology: {self._gates_article(agent)}
 
                                 Finally, you should be aware that we care about understanding whether the technology actually became a breakthrough like the MIT Technology Review claimed it would. 
                                 
@@ -318,8 +375,191 @@ for record in records:
                                 
                                 Respond exactly in the format above, do not provide any other commentary.
                                 ''')
-        response = table.update(record.id, {'flop_type': flop_type})
-        print('updated flop_type for', tech.name)
 
-    print('time taken:', time.time() - start_time)
 
+SECTIONS = ('summary', 'impact', 'author', 'opinion')
+SECTION_LABEL = re.compile(r'^[\s"*#]*(SUMMARY|IMPACT|AUTHOR|OPINION)[\s*]*:[\s*]*', re.MULTILINE)
+
+
+def parse_sections(text: str) -> Optional[dict[str, str]]:
+    labels = list(SECTION_LABEL.finditer(text))
+    sections: dict[str, str] = {}
+    for label, following in zip(labels, labels[1:] + [None]):
+        body = text[label.end():following.start() if following else len(text)]
+        sections.setdefault(label.group(1).lower(), body.strip().strip('"*').strip())
+    if all(sections.get(section) for section in SECTIONS):
+        return sections
+    return None
+
+
+def summarize(technology: Technology, summarizer: Agent, cleaner: Agent) -> tuple[str, str, str, str]:
+        extractions = technology.summarize(summarizer)
+        sections = parse_sections(extractions)
+        if sections is None:
+            # only when the summarizer strayed from its format does the cleaner get involved, once, for all four sections
+            try:
+                sections = cleaner.run_json(f'Do not add any text of your own. Split the following text into its "SUMMARY:", "IMPACT:", "AUTHOR:" and "OPINION:" sections and return a JSON object with the keys "summary", "impact", "author" and "opinion", each holding the text of that section verbatim without its label: "{extractions}"')
+            except json.JSONDecodeError as error:
+                raise ValueError(f'the cleaner returned invalid JSON for the summary of {technology.name}: {error}') from error
+            if not isinstance(sections, dict):
+                raise ValueError(f'the cleaner returned {type(sections).__name__} instead of an object for the summary of {technology.name}')
+            missing = [section for section in SECTIONS if not isinstance(sections.get(section), str)]
+            if missing:
+                raise ValueError(f'could not extract {", ".join(missing)} from the summary of {technology.name}')
+        return (sections['summary'], sections['impact'], sections['author'], sections['opinion'])
+
+
+def pipeline(agents: dict[AgentInfo, Agent], cheap_agents: dict[AgentInfo, list[Agent]], routing: RoutingStats) -> Pipeline:
+    social_benefits = agents[AgentInfo.social_benefits]
+    (flop_info, quant_qual_info) = (AgentInfo.general_gates, AgentInfo.social_benefits_gates) if HOIST_GATES_ARTICLE else (AgentInfo.general, AgentInfo.social_benefits)
+
+    def salt(*infos: AgentInfo) -> str:
+        return ''.join(info.modelfile() for info in infos)
+
+    def route(name: str, info: AgentInfo, parser: Any) -> CascadeRouter:
+        return CascadeRouter(name, cheap_agents.get(info, []), agents[info], parser, routing)
+
+    levels = Label(('High', 'Medium', 'Low'))
+    impact_level = route('impact_level', AgentInfo.general, Label(('Low Impact', 'Medium Impact', 'High Impact')))
+    type = route('type', AgentInfo.general, Label(('software', 'hardware', 'nanotech', 'biotech', 'climate/energy', 'other')))
+    actual_level = route('social_impact_level', AgentInfo.social_benefits, levels)
+    potential_level = route('social_impact_potential_level', AgentInfo.social_benefits, levels)
+    spi_impact = route('spi_impact', AgentInfo.social_benefits, Percentage())
+    quant_qual = route('quant_qual', quant_qual_info, Label(('quantity of life', 'quality of life', 'both', 'neither')))
+
+    def summary(tech: Technology) -> dict[str, str]:
+        (summary, impact, author, opinion) = summarize(tech, summarizer=agents[AgentInfo.summarizer], cleaner=agents[AgentInfo.cleaner])
+        return {'summary': summary, 'impact': impact, 'author': author, 'opinion': opinion}
+
+    article = ('name', 'year', 'tr_text')
+    return Pipeline([
+        Stage('summary', article, ('summary', 'impact', 'author', 'opinion'), summary, salt(AgentInfo.summarizer, AgentInfo.cleaner)),
+        Stage('impact_level', article, ('impact_level',), lambda tech: {'impact_level': tech.fulfillment(impact_level)}, impact_level.salt()),
+        Stage('optimist', article, ('optimist',), lambda tech: {'optimist': tech.opinion_of(agents[AgentInfo.optimist])}, salt(AgentInfo.optimist)),
+        Stage('pessimist', article, ('pessimist',), lambda tech: {'pessimist': tech.opinion_of(agents[AgentInfo.pessimist])}, salt(AgentInfo.pessimist)),
+        Stage('type', ('name', 'tr_text'), ('type',), lambda tech: {'type': tech.classify_type(type)}, type.salt()),
+        # the levels are their own stages, so switching the cascade on or off doesn't invalidate the large model's text
+        Stage('social_impact', article, ('social_impact',), lambda tech: {'social_impact': tech.social_impact_of(social_benefits)}, salt(AgentInfo.social_benefits)),
+        Stage('social_impact_level', ('name', 'social_impact'), ('social_impact_level',), lambda tech: {'social_impact_level': tech.social_impact_level_of(actual_level)}, actual_level.salt()),
+        Stage('social_impact_potential', ('name', 'tr_text'), ('social_impact_potential',), lambda tech: {'social_impact_potential': tech.social_impact_potential_of(social_benefits)}, salt(AgentInfo.social_benefits)),
+        Stage('social_impact_potential_level', ('name', 'social_impact_potential'), ('social_impact_potential_level',), lambda tech: {'social_impact_potential_level': tech.social_impact_potential_level_of(potential_level)}, potential_level.salt()),
+        Stage('spi_impact', ('name', 'year', 'social_impact', 'social_impact_potential'), ('spi_impact',), lambda tech: {'spi_impact': tech.spi(spi_impact)}, spi_impact.salt()),
+        Stage('quant_qual', article, ('quant_qual',), lambda tech: {'quant_qual': tech.quality_of_life(quant_qual)}, quant_qual.salt() + gates_article),
+        Stage('flop_type', article + ('social_impact', 'social_impact_potential', 'spi_impact', 'optimist', 'pessimist', 'impact', 'opinion'), ('flop_type',), lambda tech: {'flop_type': tech.flop(agents[flop_info])}, salt(flop_info) + gates_article),
+    ])
+
+
+# how many requests each base model may have in flight at once; anything not listed gets one
+MODEL_CONCURRENCY = {
+    Model.phi3.value: 8,
+    Model.gemma2.value: 4,
+    Model.llama31.value: 2,
+    Model.qwen2.value: 2,
+    Model.deepseek.value: 2,
+}
+# put the Bill Gates article in the system prompt of the stages that use it instead of inlining it in every prompt
+HOIST_GATES_ARTICLE = os.getenv('HOIST_GATES_ARTICLE', '1') not in ('', '0')
+# small models that answer the single-label stages first, escalating to the agent's own model only when they
+# give an invalid label or disagree; set CASCADE=0 to send everything straight to the large model
+CASCADE_MODELS = (Model.phi3, Model.gemma2) if os.getenv('CASCADE', '1') not in ('', '0') else ()
+CASCADE_AGENTS = (AgentInfo.general, AgentInfo.social_benefits, AgentInfo.social_benefits_gates)
+# comma-separated ollama servers to spread requests over, e.g. "http://gpu1:11434,http://gpu2:11434"
+OLLAMA_HOSTS = [host.strip() for host in os.getenv('OLLAMA_HOSTS', '').split(',') if host.strip()]
+RECORD_CONCURRENCY = int(os.getenv('RECORD_CONCURRENCY', 4))
+LLM_CACHE = os.getenv('LLM_CACHE', os.path.join(os.path.dirname(__file__), '.llm_cache.sqlite'))
+LLM_CACHE_BYPASS = os.getenv('LLM_CACHE_BYPASS', '') not in ('', '0')
+AIRTABLE_JOURNAL = os.getenv('AIRTABLE_JOURNAL', os.path.join(os.path.dirname(__file__), '.airtable_journal.jsonl'))
+# work from a local snapshot (seeded from the bundled csv when empty) without touching airtable; it is kept apart
+# from the airtable snapshot, whose records must all have real airtable ids
+OFFLINE = os.getenv('OFFLINE', '') not in ('', '0')
+SNAPSHOT = os.getenv('SNAPSHOT', os.path.join(os.path.dirname(__file__), '.snapshot-offline.sqlite' if OFFLINE else '.snapshot.sqlite'))
+SNAPSHOT_CSV = os.path.join(os.path.dirname(__file__), 'breakthrough_technologies.csv')
+FINGERPRINTS = os.getenv('FINGERPRINTS', os.path.join(os.path.dirname(__file__), '.fingerprints.sqlite'))
+# where fingerprints were kept before they moved to sqlite; read once if FINGERPRINTS is still empty
+LEGACY_FINGERPRINTS = os.path.join(os.path.dirname(__file__), '.fingerprints.json')
+
+
+def load_records(store: SnapshotStore) -> list[Record]:
+    # the text fields stay in the store and are read back one record at a time as stages need them; the last few
+    # reads are kept, since every stage of a record in flight (and its fingerprint) reads tr_text again
+    columns = [column for column in store.columns if column not in TEXT_FIELDS]
+    get = lru_cache(maxsize=2 * RECORD_CONCURRENCY * len(TEXT_FIELDS))(store.get)
+    return [Record(record, partial(get, record['id'])) for record in store.all(columns=columns)]
+
+
+def enrich(technologies: dict[str, Technology], client: Any, hosts: int, cache: Optional[ResponseCache], fingerprints: FingerprintStore, commit: Callable[[str, str, dict[str, Any]], None]) -> tuple[Scheduler, Usage, RoutingStats]:
+    # the per-model limits are per server
+    limiter = ModelLimiter({model: limit * hosts for model, limit in MODEL_CONCURRENCY.items()}, default=hosts)
+    usage = Usage()
+    agents = {info: Agent(info, limiter, cache, usage, client=client) for info in AgentInfo}
+    cheap_agents = {info: [Agent(info, limiter, cache, usage, model, client) for model in CASCADE_MODELS] for info in CASCADE_AGENTS}
+    provision_agents(client, [*agents.values(), *(agent for cheap in cheap_agents.values() for agent in cheap)])
+    routing = RoutingStats()
+
+    scheduler = Scheduler(fingerprints, max_records=RECORD_CONCURRENCY)
+    scheduler.run(technologies, pipeline(agents, cheap_agents, routing), commit)
+    return (scheduler, usage, routing)
+
+
+def main():
+    store = SnapshotStore(SNAPSHOT, ARTICLE_FIELDS + ENRICHMENT_FIELDS, indexed=ENRICHMENT_FIELDS)
+    writer = None
+    if OFFLINE:
+        if store.count() == 0:
+            print('seeded snapshot with', store.load_csv(SNAPSHOT_CSV), 'records from', SNAPSHOT_CSV)
+    else:
+        load_dotenv()
+        token = os.getenv('AIRTABLE_TOKEN') # get your token from online and then put it into the .env file as "AIRTABLE_TOKEN=your_token_here"
+        api = Api(api_key=token)
+        table = api.table('appOHJEmEMgO9CV6X', 'tblPEUr3QOpPlxIYY')
+        writer = WriteBehindTable(table, AIRTABLE_JOURNAL)
+        print('synced', store.sync(table, source='appOHJEmEMgO9CV6X/tblPEUr3QOpPlxIYY'), 'records from airtable')
+
+        # results computed by an earlier run that never reached airtable
+        for record_id, fields in writer.pending().items():
+            store.update(record_id, fields)
+
+    for field in ENRICHMENT_FIELDS:
+        print(f'{field}: {len(store.missing(field))} missing')
+
+    records = load_records(store)
+    technologies = {record.id: record.technology for record in records}
+
+    def commit(record_id: str, stage: str, fields: dict[str, Any]):
+        store.update(record_id, fields)
+        if writer is not None:
+            writer.update(record_id, fields)
+        print('updated', stage, 'for', technologies[record_id].name)
+
+    # early summaries kept the section label in the author field
+    for record in records:
+        author = record.technology.author
+        if author is not None and author.startswith('AUTHOR:'):
+            record.technology.author = author[7:].strip()
+            commit(record.id, 'author', {'author': record.technology.author})
+
+    client = OllamaPool(OLLAMA_HOSTS) if OLLAMA_HOSTS else ollama
+    cache = ResponseCache(LLM_CACHE, bypass=LLM_CACHE_BYPASS)
+    fingerprints = FingerprintStore(FINGERPRINTS, legacy=LEGACY_FINGERPRINTS)
+    try:
+        (scheduler, usage, routing) = enrich(technologies, client, max(len(OLLAMA_HOSTS), 1), cache, fingerprints, commit)
+    finally:
+        if writer is not None:
+            writer.close()
+        store.close()
+        fingerprints.close()
+    print(scheduler.timings.report())
+    print(scheduler.report())
+    print(usage.report())
+    print(routing.report())
+    print(cache.report())
+    if writer is not None:
+        print('airtable requests for updates:', writer.requests)
+    cache.close()
+    if client is not ollama:
+        print(client.report())
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
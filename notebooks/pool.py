@@ -0,0 +1,177 @@
+import re
+import threading
+from typing import Any, Callable, Iterator, Optional
+
+import httpx
+import ollama
+
+# how many extra in-flight requests a host that already serves a model may carry before a host that would have to
+# load the model is preferred; swapping a 70B model in and out costs far more than a short queue
+AFFINITY_BONUS = 2
+FROM = re.compile(r'^\s*FROM\s+(\S+)', re.MULTILINE | re.IGNORECASE)
+
+
+class Host:
+    def __init__(self, url: str, timeout: float, connections: int):
+        self.url = url
+        # each client holds its own pool of keep-alive connections to the host
+        self.client = ollama.Client(host=url, timeout=timeout, limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections))
+        self.outstanding = 0
+        self.healthy = True
+        # base models (the FROM of a created model) the host has served, i.e. whose weights it likely has loaded
+        self.models: set[str] = set()
+
+
+class OllamaPool:
+    # stands in for the ollama module: list, create and generate are sent to one of several servers, picking the
+    # least busy healthy host and preferring hosts that already have the model loaded
+    def __init__(self, urls: list[str], timeout: float = 600, retries: int = 2, probe_interval: float = 30, connections: int = 8):
+        if not urls:
+            raise ValueError('an ollama pool needs at least one host')
+        self.hosts = [Host(url, timeout, connections) for url in urls]
+        self.retries = retries
+        # everything created through the pool, so a host that comes back up can be given what it missed
+        self._created: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._prober = threading.Thread(target=self._probe_periodically, args=(probe_interval,), daemon=True, name='ollama-probe')
+        self._prober.start()
+
+    def create(self, model: str, modelfile: str, stream: bool = False) -> dict[str, Any]:
+        # every host may be asked to run any agent, so each needs the model; creation is always waited for, `stream`
+        # is only accepted to match ollama.create
+        with self._lock:
+            self._created[model] = modelfile
+        responses = []
+        for host in self._healthy():
+            try:
+                responses.append(host.client.create(model=model, modelfile=modelfile, stream=False))
+            except httpx.TransportError:
+                with self._lock:
+                    host.healthy = False
+        if not responses:
+            raise ConnectionError(f'no ollama host could create {model}')
+        failed = [response for response in responses if response['status'] != 'success']
+        return failed[0] if failed else responses[0]
+
+    def generate(self, model: str, prompt: str, stream: bool = False, **options: Any) -> Any:
+        # agents built on the same base model share its weights, so affinity follows the base model, not the agent
+        base = self._base(model)
+        if stream:
+            return self._stream(base, lambda host: host.client.generate(model=model, prompt=prompt, stream=True, **options))
+        return self._call(base, lambda host: host.client.generate(model=model, prompt=prompt, **options))
+
+    def close(self):
+        self._closed.set()
+        self._prober.join()
+
+    def report(self) -> str:
+        with self._lock:
+            return 'ollama hosts: ' + ', '.join(f'{host.url} ({"up" if host.healthy else "down"}, {len(host.models)} models)' for host in self.hosts)
+
+    def _base(self, model: str) -> str:
+        with self._lock:
+            modelfile = self._created.get(model)
+        match = FROM.search(modelfile) if modelfile is not None else None
+        return match.group(1) if match else model
+
+    def _healthy(self) -> list[Host]:
+        with self._lock:
+            return [host for host in self.hosts if host.healthy]
+
+    def _acquire(self, model: Optional[str], tried: set[str]) -> Optional[Host]:
+        with self._lock:
+            candidates = [host for host in self.hosts if host.healthy and host.url not in tried]
+            if not candidates:
+                return None
+            host = min(candidates, key=lambda host: host.outstanding - (AFFINITY_BONUS if model in host.models else 0))
+            host.outstanding += 1
+            return host
+
+    def _release(self, host: Host, healthy: bool = True):
+        with self._lock:
+            host.outstanding -= 1
+            host.healthy = host.healthy and healthy
+
+    def _call(self, model: Optional[str], request: Callable[[Host], Any], release: bool = True) -> Any:
+        tried: set[str] = set()
+        error: Optional[Exception] = None
+        for _ in range(self.retries + 1):
+            host = self._acquire(model, tried)
+            if host is None:
+                break
+            tried.add(host.url)
+            try:
+                response = request(host)
+            # timeouts and refused or dropped connections
+            except httpx.TransportError as failure:
+                self._release(host, healthy=False)
+                error = failure
+                continue
+            except ollama.ResponseError as failure:
+                # 404 is a host that missed model creation while it was down, which another host can cover
+                self._release(host, healthy=failure.status_code < 500)
+                if 400 <= failure.status_code < 500 and failure.status_code != 404:
+                    raise
+                error = failure
+                continue
+            # only a host that actually served the model has it loaded
+            if model is not None:
+                with self._lock:
+                    host.models.add(model)
+            if not release:
+                return (response, host)
+            self._release(host)
+            return response
+        raise ConnectionError(f'no ollama host could serve {model or "the request"}') from error
+
+    def _stream(self, model: str, request: Callable[[Host], Iterator[Any]]) -> Iterator[Any]:
+        # the request is only sent once the stream is read, so the first chunk is pulled inside _call where a failing
+        # host can still be swapped for another; after that the host stays busy until the stream is finished or closed
+        def started(host: Host) -> tuple[Any, Iterator[Any]]:
+            chunks = request(host)
+            return (next(chunks), chunks)
+
+        ((first, chunks), host) = self._call(model, started, release=False)
+        try:
+            yield first
+            yield from chunks
+        finally:
+            # closing the response is what tells the server to stop generating
+            chunks.close()
+            self._release(host)
+
+    def _probe_periodically(self, interval: float):
+        while not self._closed.wait(interval):
+            for host in self.hosts:
+                try:
+                    loaded = {self._base(model['name']) for model in host.client.ps()['models']}
+                    if not host.healthy:
+                        with self._lock:
+                            created = dict(self._created)
+                        for model, modelfile in created.items():
+                            host.client.create(model=model, modelfile=modelfile, stream=False)
+                except Exception:
+                    with self._lock:
+                        host.healthy = False
+                    continue
+                with self._lock:
+                    host.healthy = True
+                    # anything this pool routed there keeps its affinity until the host is down
+                    host.models |= loaded
+
+    # defined last: inside the class body the name shadows the builtin used in the annotations above
+    def list(self) -> dict[str, Any]:
+        # a model only counts as present if every healthy host has it
+        names: Optional[set[str]] = None
+        for host in self._healthy():
+            try:
+                present = {model['name'] for model in host.client.list()['models']}
+            except httpx.TransportError:
+                with self._lock:
+                    host.healthy = False
+                continue
+            names = present if names is None else names & present
+        if names is None:
+            raise ConnectionError('no ollama host could list its models')
+        return {'models': [{'name': name} for name in sorted(names)]}
@@ -0,0 +1,37 @@
+import hashlib
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+
+class ProvisioningError(RuntimeError):
+    pass
+
+
+def tagged(name: str, modelfile: str) -> str:
+    # the tag is a hash of the modelfile, so a model of that name on the server is exactly the one we'd create
+    digest = hashlib.sha256(textwrap.dedent(modelfile).strip().encode()).hexdigest()
+    return f'{name}:{digest[:12]}'
+
+
+def provision(client: Any, models: dict[str, str], workers: int = 4) -> list[str]:
+    # creates whichever of `models` ({tagged name: modelfile}) the server doesn't have yet, in parallel, and
+    # raises before any work starts if one can't be created
+    try:
+        existing = {model['name'] for model in client.list()['models']}
+    except Exception as error:
+        raise ProvisioningError(f'could not list the models on the ollama server: {error}') from error
+    missing = {name: modelfile for name, modelfile in models.items() if name not in existing}
+
+    def create(name: str) -> str:
+        try:
+            response = client.create(model=name, modelfile=missing[name], stream=False)
+        except Exception as error:
+            return f'{name}: {error}'
+        return '' if response['status'] == 'success' else f'{name}: {response["status"]}'
+
+    with ThreadPoolExecutor(workers, thread_name_prefix='provision') as pool:
+        failures = [failure for failure in pool.map(create, missing) if failure]
+    if failures:
+        raise ProvisioningError('could not create ' + '; '.join(failures) + ' (is the base model pulled on every host?)')
+    return list(missing)
@@ -0,0 +1,137 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Iterable, Optional
+
+WORDS_OF_SLACK = 4
+PERCENT = re.compile(r'(?<![\w.])([-+−]?\d+(?:\.\d+)?)\s*%')
+# what may wrap an answer given on its own, and what ends it: a line break or the end of a sentence
+QUOTES = '"\'*`'
+ENDED = re.compile(r'\s*(\n|\.\s)')
+
+
+class Label:
+    stop = ('\n\n',)
+
+    def __init__(self, choices: Iterable[str]):
+        self.choices = tuple(choices)
+        # room for the label and the few words of slack parse() allows, never for an essay
+        self.num_predict = 4 * (max(len(choice.split()) for choice in self.choices) + WORDS_OF_SLACK)
+
+    def final(self, answer: str) -> Optional[str]:
+        # a label alone on its line or in its sentence, which nothing streamed after it can change
+        text = answer.lstrip().lstrip(QUOTES)
+        for choice in self.choices:
+            if text[:len(choice)].lower() == choice.lower() and ENDED.match(text[len(choice):].lstrip(QUOTES)):
+                return choice
+        return None
+
+    def parse(self, answer: str) -> Optional[str]:
+        final = self.final(answer)
+        if final is not None:
+            return final
+        text = answer.strip().strip('."\'*`').strip().lower()
+        for choice in self.choices:
+            if text == choice.lower():
+                return choice
+        # tolerate a few words around the label ("Answer: High"), but not a paragraph that happens to mention one
+        if len(text.split()) > max(len(choice.split()) for choice in self.choices) + WORDS_OF_SLACK:
+            return None
+        found = {choice for choice in self.choices if re.search(rf'(?<!\w){re.escape(choice.lower())}(?!\w)', text)}
+        return found.pop() if len(found) == 1 else None
+
+    def agree(self, first: str, second: str) -> bool:
+        return first == second
+
+
+class Percentage:
+    stop = ('\n\n',)
+    num_predict = 4 * WORDS_OF_SLACK
+
+    def __init__(self, tolerance: float = 2):
+        self.tolerance = tolerance
+
+    def final(self, answer: str) -> Optional[str]:
+        match = re.match(rf'\s*[{QUOTES}]*([-+−]?\d+(?:\.\d+)?)\s*%[{QUOTES}]*', answer)
+        if match is None or not ENDED.match(answer[match.end():]):
+            return None
+        return f'{float(match.group(1).replace("−", "-")):g}%'
+
+    def parse(self, answer: str) -> Optional[str]:
+        final = self.final(answer)
+        if final is not None:
+            return final
+        numbers = PERCENT.findall(answer)
+        if len(numbers) != 1 or len(answer.split()) > WORDS_OF_SLACK:
+            return None
+        return f'{float(numbers[0].replace("−", "-")):g}%'
+
+    def agree(self, first: str, second: str) -> bool:
+        (a, b) = (float(first[:-1]), float(second[:-1]))
+        if abs(a) < 0.01 and abs(b) < 0.01:
+            return True
+        # same sign and within `tolerance` times of each other, i.e. the same order of magnitude the prompt asks for
+        return a * b > 0 and max(abs(a), abs(b)) <= self.tolerance * min(abs(a), abs(b))
+
+
+class RoutingStats:
+    def __init__(self):
+        self._stages: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, **counters: float):
+        with self._lock:
+            for counter, value in counters.items():
+                self._stages[stage][counter] += value
+
+    def report(self) -> str:
+        lines = ['routing:']
+        with self._lock:
+            stages = {stage: dict(counters) for stage, counters in self._stages.items()}
+        for stage, counters in sorted(stages.items()):
+            (accepted, escalated) = (counters.get('accepted', 0), counters.get('escalated', 0))
+            strong = counters.get('strong_seconds', 0)
+            # what the accepted answers would have cost on the large model, going by the escalations we did see
+            avoided = f'{accepted * strong / escalated:.1f}s' if escalated else 'n/a'
+            lines.append(f'  {stage:<32} answered cheaply={accepted:<5.0f} escalated={escalated:<5.0f} cheap time={counters.get("cheap_seconds", 0):7.1f}s  large model time={strong:7.1f}s  large model time avoided≈{avoided}')
+        return '\n'.join(lines)
+
+
+class CascadeRouter:
+    # asks the cheap agents first and only escalates to the strong one when an answer isn't one of the allowed
+    # labels or the cheap agents disagree; with no cheap agents it is a plain call to the strong agent
+    def __init__(self, name: str, cheap: list[Any], strong: Any, parser: Any, stats: RoutingStats):
+        self.name = name
+        self.cheap = cheap
+        self.strong = strong
+        self.parser = parser
+        self.stats = stats
+
+    @property
+    def info(self) -> Any:
+        return self.strong.info
+
+    def salt(self) -> str:
+        return ''.join(agent.modelfile for agent in [*self.cheap, self.strong])
+
+    def run(self, prompt: str, parser: Optional[Any] = None) -> str:
+        # `parser` is only there to match Agent.run; the router always bounds calls with its own
+        answers: list[str] = []
+        start = time.perf_counter()
+        for agent in self.cheap:
+            answer = self.parser.parse(agent.run(prompt, self.parser))
+            if answer is None or (answers and not self.parser.agree(answers[0], answer)):
+                break
+            answers.append(answer)
+        if self.cheap:
+            self.stats.add(self.name, cheap_seconds=time.perf_counter() - start)
+            if len(answers) == len(self.cheap):
+                self.stats.add(self.name, accepted=1)
+                return answers[0]
+
+        start = time.perf_counter()
+        answer = self.strong.run(prompt, self.parser)
+        if self.cheap:
+            self.stats.add(self.name, escalated=1, strong_seconds=time.perf_counter() - start)
+        return self.parser.parse(answer) or answer
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+from graphlib import TopologicalSorter
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+_local = threading.local()
+
+
+def current_stage() -> Optional[str]:
+    # the stage the calling thread is running, so LLM usage can be attributed to it
+    return getattr(_local, 'stage', None)
+
+
+class ModelLimiter:
+    # one semaphore per base model, so callers block (backpressure) instead of piling requests onto a busy server
+    def __init__(self, limits: dict[str, int], default: int = 1):
+        self.limits = limits
+        self.default = default
+        self._semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, model: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if model not in self._semaphores:
+                self._semaphores[model] = threading.BoundedSemaphore(self.limits.get(model, self.default))
+            return self._semaphores[model]
+
+    @contextmanager
+    def slot(self, model: str) -> Iterator[None]:
+        semaphore = self._semaphore(model)
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+class Timings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages: dict[str, list[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self._stages[stage].append(seconds)
+
+    def stages(self) -> dict[str, list[float]]:
+        with self._lock:
+            return {stage: list(durations) for stage, durations in self._stages.items()}
+
+    def report(self) -> str:
+        lines = [f'wall clock: {time.perf_counter() - self.started:.1f}s']
+        for stage, durations in sorted(self.stages().items()):
+            lines.append(f'  {stage:<30} n={len(durations):<5} total={sum(durations):8.1f}s  mean={sum(durations) / len(durations):6.1f}s  max={max(durations):6.1f}s')
+        return '\n'.join(lines)
+
+
+class Usage:
+    # token counts and server-side durations (nanoseconds) as reported in each ollama response, plus the client-side
+    # timings (seconds) of streamed calls; a stream cut short never gets the server's counts, so those are over the
+    # calls that ran to the end and the per-call prompt size is what to compare between runs
+    COUNTERS = ('prompt_eval_count', 'eval_count', 'prompt_eval_duration', 'eval_duration', 'total_duration', 'streams', 'cut_short', 'first_token_seconds', 'stream_tokens', 'stream_seconds')
+
+    def __init__(self):
+        self._totals: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    def add(self, label: str, response: dict[str, Any]):
+        with self._lock:
+            totals = self._totals[label]
+            totals['calls'] += 1
+            for counter in self.COUNTERS:
+                totals[counter] += response.get(counter) or 0
+
+    def totals(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {label: dict(totals) for label, totals in self._totals.items()}
+
+    def report(self) -> str:
+        lines = ['llm usage:']
+        for label, totals in sorted(self.totals().items()):
+            metered = totals['calls'] - totals['cut_short']
+            per_call = totals['prompt_eval_count'] / metered if metered else 0
+            line = f'  {label:<30} calls={totals["calls"]:<5.0f} prompt tokens={totals["prompt_eval_count"]:<8.0f} ({per_call:6.0f}/call, {totals["prompt_eval_duration"] / 1e9:7.1f}s)  eval tokens={totals["eval_count"]:<7.0f} ({totals["eval_duration"] / 1e9:7.1f}s)'
+            if totals['streams']:
+                rate = totals['stream_tokens'] / totals['stream_seconds'] if totals['stream_seconds'] else 0
+                line += f'  streamed={totals["streams"]:.0f} (cut short {totals["cut_short"]:.0f}, not in the token counts)  time to first token={totals["first_token_seconds"] / totals["streams"]:5.2f}s  {rate:6.1f} tokens/s'
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    inputs: tuple[str, ...]
+    outputs: tuple[str, ...]
+    run: Callable[[Any], dict[str, Any]]
+    # anything besides the input fields that shapes the output, e.g. the modelfiles of the agents the stage uses
+    salt: str = ''
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        producers: dict[str, str] = {}
+        for stage in stages:
+            for field in stage.outputs:
+                if field in producers:
+                    raise ValueError(f'{field} is produced by both {producers[field]} and {stage.name}')
+                producers[field] = stage.name
+        self.dependencies = {stage.name: {producers[field] for field in stage.inputs if field in producers} for stage in stages}
+        # raises graphlib.CycleError up front rather than halfway through a run
+        TopologicalSorter(self.dependencies).prepare()
+
+    def fingerprint(self, stage: Stage, subject: Any) -> str:
+        inputs = [getattr(subject, field, None) for field in stage.inputs]
+        return hashlib.sha256(json.dumps([stage.name, stage.salt, inputs], default=str).encode()).hexdigest()
+
+
+class FingerprintStore:
+    # (record id, field) -> fingerprint of the stage inputs that produced it, one row each, so recording a stage
+    # writes only its own fields; `legacy` is a .fingerprints.json from before, imported once into an empty store
+    def __init__(self, path: str, legacy: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS fingerprints (key TEXT NOT NULL, field TEXT NOT NULL, fingerprint TEXT NOT NULL, PRIMARY KEY (key, field))')
+        if legacy is not None and os.path.exists(legacy) and self._db.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0] == 0:
+            with open(legacy) as file:
+                fingerprints: dict[str, dict[str, str]] = json.load(file)
+            self._db.executemany('INSERT INTO fingerprints VALUES (?, ?, ?)', [(key, field, fingerprint) for key, fields in fingerprints.items() for field, fingerprint in fields.items()])
+        self._db.commit()
+
+    def get(self, key: str, field: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute('SELECT fingerprint FROM fingerprints WHERE key = ? AND field = ?', (key, field)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, fields: Iterable[str], fingerprint: str):
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)', [(key, field, fingerprint) for field in fields])
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class Scheduler:
+    # records run concurrently on one pool, the stages of each record on another, so a record waiting on its
+    # stages never holds up the threads doing the actual work
+    def __init__(self, fingerprints: FingerprintStore, max_records: int = 4, max_stages: int = 16):
+        self.fingerprints = fingerprints
+        self.max_records = max_records
+        self.max_stages = max_stages
+        self.timings = Timings()
+        # (key, stage, error) of every stage that failed or was skipped because a stage it depends on failed
+        self.failures: list[tuple[str, str, str]] = []
+        self._lock = threading.Lock()
+
+    def run(self, subjects: dict[str, Any], pipeline: Pipeline, commit: Callable[[str, str, dict[str, Any]], None]):
+        with ThreadPoolExecutor(self.max_records, thread_name_prefix='record') as records, \
+                ThreadPoolExecutor(self.max_stages, thread_name_prefix='stage') as pool:
+            pending = [records.submit(self._run_subject, pool, key, subject, pipeline, commit) for key, subject in subjects.items()]
+            for future in pending:
+                future.result()
+
+    def report(self) -> str:
+        with self._lock:
+            failures = list(self.failures)
+        lines = [f'failed stages: {len(failures)}']
+        for key, stage, error in failures:
+            lines.append(f'  {key:<20} {stage:<24} {error}')
+        return '\n'.join(lines)
+
+    def stale(self, key: str, subject: Any, stage: Stage, fingerprint: str) -> bool:
+        for field in stage.outputs:
+            if getattr(subject, field, None) is None:
+                return True
+            stored = self.fingerprints.get(key, field)
+            if stored is not None and stored != fingerprint:
+                return True
+        # outputs from before fingerprints were tracked are trusted and adopted as-is
+        if any(self.fingerprints.get(key, field) is None for field in stage.outputs):
+            self.fingerprints.set(key, stage.outputs, fingerprint)
+        return False
+
+    def _run_subject(self, pool: ThreadPoolExecutor, key: str, subject: Any, pipeline: Pipeline, commit: Callable[[str, str, dict[str, Any]], None]):
+        with self.timings.measure('record'):
+            sorter = TopologicalSorter(pipeline.dependencies)
+            sorter.prepare()
+            ran: set[str] = set()
+            failed: set[str] = set()
+            running: dict[Future, str] = {}
+            while sorter.is_active():
+                for name in sorter.get_ready():
+                    stage = pipeline.stages[name]
+                    if pipeline.dependencies[name] & failed:
+                        self._fail(key, name, 'skipped, an input stage failed')
+                        failed.add(name)
+                        sorter.done(name)
+                        continue
+                    # fingerprinted only once every upstream stage has settled, so it sees their fresh outputs
+                    fingerprint = pipeline.fingerprint(stage, subject)
+                    if pipeline.dependencies[name] & ran or self.stale(key, subject, stage, fingerprint):
+                        running[pool.submit(self._run_stage, key, subject, stage, fingerprint, commit)] = name
+                    else:
+                        sorter.done(name)
+                if running:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        (ran if future.result() else failed).add(name)
+                        sorter.done(name)
+
+    def _run_stage(self, key: str, subject: Any, stage: Stage, fingerprint: str, commit: Callable[[str, str, dict[str, Any]], None]) -> bool:
+        # a failing stage is reported at the end instead of aborting the run; its outputs keep their old fingerprint,
+        # so it is retried next time
+        _local.stage = stage.name
+        try:
+            with self.timings.measure(stage.name):
+                fields = stage.run(subject)
+            commit(key, stage.name, fields)
+        except Exception as error:
+            self._fail(key, stage.name, repr(error))
+            return False
+        finally:
+            _local.stage = None
+        for field, value in fields.items():
+            setattr(subject, field, value)
+        self.fingerprints.set(key, stage.outputs, fingerprint)
+        return True
+
+    def _fail(self, key: str, stage: str, error: str):
+        print(f'{stage} failed for {key}: {error}')
+        with self._lock:
+            self.failures.append((key, stage, error))
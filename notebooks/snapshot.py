@@ -0,0 +1,144 @@
+import csv
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, Optional
+
+SCALAR = (str, int, float, bool)
+# ids given to rows seeded from a csv export; they don't exist in airtable
+CSV_ID_PREFIX = 'csv'
+
+
+class SnapshotStore:
+    # a local copy of the airtable base, one column per known field; selections like "flop_type is null" are
+    # answered from an index on that column instead of by pulling every row (and every tr_text) over the network
+    def __init__(self, path: str, columns: Iterable[str], indexed: Iterable[str] = ()):
+        self.path = path
+        self.columns = tuple(columns)
+        self._names = ', '.join(f'"{column}"' for column in self.columns)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS records (id TEXT PRIMARY KEY, created_time TEXT, extra TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS sync (source TEXT PRIMARY KEY, synced_at TEXT NOT NULL)')
+        existing = {row[1] for row in self._db.execute('PRAGMA table_info(records)')}
+        for column in self.columns:
+            if column not in existing:
+                self._db.execute(f'ALTER TABLE records ADD COLUMN "{column}"')
+        for column in indexed:
+            self._db.execute(f'CREATE INDEX IF NOT EXISTS "records_{self._column(column)}" ON records ("{column}")')
+        self._db.commit()
+
+    def sync(self, table: Any, source: str, full: bool = False) -> int:
+        # airtable only reports modification times through formulas, so an incremental sync asks for everything
+        # modified since the previous sync started; deletions are only picked up by a full sync
+        started = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        since = None if full else self.synced_at(source)
+        if since is None:
+            records = table.all()
+        else:
+            records = table.all(formula=f"IS_AFTER(LAST_MODIFIED_TIME(), DATETIME_PARSE('{since}'))")
+        with self._lock:
+            if full:
+                self._db.execute('DELETE FROM records')
+            elif since is None:
+                # rows seeded from a csv would otherwise be enriched and written back under ids airtable rejects
+                self._db.execute("DELETE FROM records WHERE id LIKE ? || '%'", (CSV_ID_PREFIX,))
+            self._upsert(records)
+            self._db.execute('INSERT OR REPLACE INTO sync VALUES (?, ?)', (source, started))
+            self._db.commit()
+        return len(records)
+
+    def load_csv(self, path: str) -> int:
+        # rows are streamed into the store; the bundled exports have multi-line blurbs, which csv handles
+        def records() -> Iterator[dict[str, Any]]:
+            with open(path, newline='') as file:
+                for number, row in enumerate(csv.DictReader(file)):
+                    fields = {('tr_text' if key == 'blurb' else key): value for key, value in row.items() if value != ''}
+                    # a few trailing rows are notes without a technology attached
+                    if 'name' not in fields:
+                        continue
+                    if 'year' in fields:
+                        fields['year'] = int(float(fields['year']))
+                    yield {'id': f'{CSV_ID_PREFIX}{number:05}', 'createdTime': None, 'fields': fields}
+
+        with self._lock:
+            count = self._upsert(records())
+            self._db.commit()
+        return count
+
+    def synced_at(self, source: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute('SELECT synced_at FROM sync WHERE source = ?', (source,)).fetchone()
+        return row[0] if row else None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def missing(self, field: str) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute(f'SELECT id FROM records WHERE "{self._column(field)}" IS NULL ORDER BY id')]
+
+    def get(self, record_id: str, field: str) -> Any:
+        with self._lock:
+            row = self._db.execute(f'SELECT "{self._column(field)}" FROM records WHERE id = ?', (record_id,)).fetchone()
+        return row[0] if row else None
+
+    def all(self, ids: Optional[Iterable[str]] = None, columns: Optional[Iterable[str]] = None) -> list[dict[str, Any]]:
+        # same shape as pyairtable's table.all(), so the rest of the script doesn't care where records came from;
+        # `columns` leaves the others out of the fields, to be read with get() when they're needed
+        selected = self.columns if columns is None else tuple(self._column(column) for column in columns)
+        names = ', '.join(f'"{column}"' for column in selected)
+        query = f'SELECT id, created_time, extra, {names} FROM records'
+        with self._lock:
+            if ids is None:
+                rows = self._db.execute(f'{query} ORDER BY id').fetchall()
+            else:
+                wanted = list(ids)
+                rows = []
+                # sqlite caps the number of bound parameters per statement
+                for start in range(0, len(wanted), 500):
+                    chunk = wanted[start:start + 500]
+                    rows += self._db.execute(f'{query} WHERE id IN ({", ".join("?" * len(chunk))}) ORDER BY id', chunk).fetchall()
+        return [self._record(row, selected) for row in rows]
+
+    def update(self, record_id: str, fields: dict[str, Any]):
+        with self._lock:
+            columns = {field: value for field, value in fields.items() if field in self.columns and isinstance(value, SCALAR)}
+            if columns:
+                assignments = ', '.join(f'"{field}" = ?' for field in columns)
+                self._db.execute(f'UPDATE records SET {assignments} WHERE id = ?', [*columns.values(), record_id])
+            extra = {field: value for field, value in fields.items() if field not in columns}
+            if extra:
+                row = self._db.execute('SELECT extra FROM records WHERE id = ?', (record_id,)).fetchone()
+                if row is not None:
+                    self._db.execute('UPDATE records SET extra = ? WHERE id = ?', (json.dumps({**json.loads(row[0] or '{}'), **extra}), record_id))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _column(self, field: str) -> str:
+        if field not in self.columns:
+            raise KeyError(f'{field} is not a column of the snapshot')
+        return field
+
+    def _upsert(self, records: Iterable[dict[str, Any]]) -> int:
+        count = 0
+        placeholders = ', '.join('?' * (len(self.columns) + 3))
+        for record in records:
+            fields = record['fields']
+            values = [fields.get(column) if isinstance(fields.get(column), SCALAR) else None for column in self.columns]
+            extra = {field: value for field, value in fields.items() if field not in self.columns or not isinstance(value, SCALAR)}
+            self._db.execute(f'INSERT OR REPLACE INTO records (id, created_time, extra, {self._names}) VALUES ({placeholders})', [record['id'], record.get('createdTime'), json.dumps(extra), *values])
+            count += 1
+        return count
+
+    def _record(self, row: tuple, columns: tuple[str, ...]) -> dict[str, Any]:
+        (record_id, created_time, extra), values = row[:3], row[3:]
+        fields = {column: value for column, value in zip(columns, values) if value is not None}
+        fields.update(json.loads(extra or '{}'))
+        return {'id': record_id, 'createdTime': created_time, 'fields': fields}
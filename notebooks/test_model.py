@@ -0,0 +1,52 @@
+import unittest
+from typing import Any, Iterator
+
+from model import Agent, AgentInfo
+from router import Label, Percentage
+from scheduler import ModelLimiter, Usage
+
+
+class StreamingClient:
+    # streams `tokens` and records how many were read before the stream was closed
+    def __init__(self, tokens: list[str]):
+        self.tokens = tokens
+        self.sent = 0
+
+    def generate(self, model: str, prompt: str, stream: bool = False, **options: Any) -> Iterator[dict[str, Any]]:
+        for token in self.tokens:
+            self.sent += 1
+            yield {'response': token, 'done': False}
+        yield {'response': '', 'done': True, 'prompt_eval_count': 100, 'eval_count': len(self.tokens)}
+
+
+class StreamTest(unittest.TestCase):
+    def run_agent(self, tokens: list[str], parser: Any) -> tuple[str, StreamingClient, Usage]:
+        client = StreamingClient(tokens)
+        usage = Usage()
+        answer = Agent(AgentInfo.general, ModelLimiter({}), usage=usage, client=client).run('prompt', parser)
+        return (answer, client, usage)
+
+    def test_hedged_answers_are_read_to_the_end(self):
+        for tokens in [['Medium', '-', 'High'], ['Low', ' to', ' Medium'], ['Medium', '-', 'High', '\n', 'Because']]:
+            with self.subTest(tokens=tokens):
+                (answer, client, _) = self.run_agent(tokens, Label(('High', 'Medium', 'Low')))
+                self.assertEqual(client.sent, len(tokens))
+                self.assertEqual(answer, ''.join(tokens).strip())
+
+    def test_stream_stops_once_the_answer_is_final(self):
+        tokens = ['High', '\n', 'The', ' technology', ' changed', ' how', ' people', ' live']
+        (answer, client, usage) = self.run_agent(tokens, Label(('High', 'Medium', 'Low')))
+        self.assertEqual(answer, 'High')
+        self.assertEqual(client.sent, 2)
+        totals = usage.totals()['general']
+        self.assertEqual((totals['cut_short'], totals['prompt_eval_count']), (1, 0))
+        self.assertIn('cut short 1, not in the token counts', usage.report())
+
+    def test_percentage_is_not_cut_before_its_sign(self):
+        (answer, client, usage) = self.run_agent(['0', '.5', '%'], Percentage())
+        self.assertEqual((answer, client.sent), ('0.5%', 3))
+        self.assertEqual(usage.totals()['general']['prompt_eval_count'], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+import json
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import ollama
+
+from pool import OllamaPool
+
+
+class StubOllama:
+    # just enough of the ollama HTTP API on a local port; `status` makes /api/generate fail with that status code
+    def __init__(self, status: int = 200, chunks: int = 50):
+        self.status = status
+        self.chunks = chunks
+        self.models: set[str] = set()
+        # what /api/ps reports as loaded
+        self.loaded: set[str] = set()
+        self.generated = 0
+        self.chunks_sent = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any):
+                pass
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self.reply(200, {'models': [{'name': name} for name in sorted(stub.models)]})
+                elif self.path == '/api/ps':
+                    self.reply(200, {'models': [{'name': name} for name in sorted(stub.loaded)]})
+                else:
+                    self.reply(404, {'error': 'not found'})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if self.path == '/api/create':
+                    stub.models.add(body['name'])
+                    self.reply(200, {'status': 'success'})
+                elif self.path == '/api/generate':
+                    stub.generated += 1
+                    if stub.status != 200:
+                        self.reply(stub.status, {'error': f'status {stub.status}'})
+                    elif body.get('stream'):
+                        self.stream()
+                    else:
+                        self.reply(200, {'response': 'High', 'done': True, 'eval_count': 1})
+
+            def reply(self, status: int, payload: dict[str, Any]):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def stream(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+                try:
+                    for index in range(stub.chunks):
+                        self.wfile.write(json.dumps({'response': f' word{index}', 'done': index == stub.chunks - 1}).encode() + b'\n')
+                        self.wfile.flush()
+                        stub.chunks_sent += 1
+                        time.sleep(0.01)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def unused_url() -> str:
+    # a port nothing listens on, for a host that refuses connections
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+
+class OllamaPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.stubs: list[StubOllama] = []
+        self.pools: list[OllamaPool] = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close()
+        for stub in self.stubs:
+            stub.close()
+
+    def stub(self, **options: Any) -> StubOllama:
+        stub = StubOllama(**options)
+        self.stubs.append(stub)
+        return stub
+
+    def pool(self, urls: list[str], probe_interval: float = 3600) -> OllamaPool:
+        pool = OllamaPool(urls, timeout=5, probe_interval=probe_interval)
+        self.pools.append(pool)
+        return pool
+
+    def test_fails_over_from_a_refused_connection(self):
+        live = self.stub()
+        pool = self.pool([unused_url(), live.url])
+        self.assertEqual(pool.generate('general:abc', 'prompt')['response'], 'High')
+        (dead, served) = pool.hosts
+        self.assertFalse(dead.healthy)
+        self.assertEqual((dead.models, served.models), (set(), {'general:abc'}))
+
+    def test_retries_a_404_elsewhere_and_keeps_the_host(self):
+        missing = self.stub(status=404)
+        live = self.stub()
+        pool = self.pool([missing.url, live.url])
+        pool.generate('general:abc', 'prompt')
+        self.assertEqual((missing.generated, live.generated), (1, 1))
+        self.assertTrue(pool.hosts[0].healthy)
+        self.assertEqual(pool.hosts[0].models, set())
+
+    def test_server_error_marks_the_host_down(self):
+        failing = self.stub(status=500)
+        live = self.stub()
+        pool = self.pool([failing.url, live.url])
+        pool.generate('general:abc', 'prompt')
+        self.assertFalse(pool.hosts[0].healthy)
+        self.assertEqual(live.generated, 1)
+
+    def test_other_client_errors_are_raised_without_retrying(self):
+        failing = self.stub(status=400)
+        live = self.stub()
+        pool = self.pool([failing.url, live.url])
+        with self.assertRaises(ollama.ResponseError):
+            pool.generate('general:abc', 'prompt')
+        self.assertEqual(live.generated, 0)
+        self.assertTrue(pool.hosts[0].healthy)
+
+    def test_no_healthy_host_raises(self):
+        pool = self.pool([unused_url()])
+        with self.assertRaises(ConnectionError):
+            pool.generate('general:abc', 'prompt')
+
+    def test_closing_a_stream_releases_the_host_and_stops_the_server(self):
+        live = self.stub(chunks=200)
+        pool = self.pool([live.url])
+        chunks = pool.generate('general:abc', 'prompt', stream=True)
+        for _ in range(3):
+            next(chunks)
+        self.assertEqual(pool.hosts[0].outstanding, 1)
+        chunks.close()
+        self.assertEqual(pool.hosts[0].outstanding, 0)
+        time.sleep(0.2)
+        self.assertLess(live.chunks_sent, 200)
+
+    def test_prefers_the_host_that_already_served_the_model(self):
+        (first, second) = (self.stub(), self.stub())
+        pool = self.pool([first.url, second.url])
+        pool.hosts[0].outstanding = 1
+        pool.generate('general:abc', 'prompt')
+        self.assertEqual((first.generated, second.generated), (0, 1))
+        pool.hosts[0].outstanding = 0
+        pool.hosts[1].outstanding = 1
+        # busier by one, but within AFFINITY_BONUS, so the model stays where it is loaded
+        pool.generate('general:abc', 'prompt')
+        self.assertEqual((first.generated, second.generated), (0, 2))
+
+    def test_agents_on_the_same_base_model_share_affinity(self):
+        (first, second) = (self.stub(), self.stub())
+        pool = self.pool([first.url, second.url])
+        for (name, base) in [('general:abc', 'llama3.1:70b'), ('optimist:def', 'llama3.1:70b'), ('general-phi3:123', 'phi3:14b')]:
+            pool.create(name, f'\n    FROM {base}\n    SYSTEM "be brief"\n')
+        pool.hosts[0].outstanding = 1
+        pool.generate('general:abc', 'prompt')
+        self.assertEqual(pool.hosts[1].models, {'llama3.1:70b'})
+        (pool.hosts[0].outstanding, pool.hosts[1].outstanding) = (0, 1)
+        # a different agent, but that host already has its weights loaded
+        pool.generate('optimist:def', 'prompt')
+        self.assertEqual((first.generated, second.generated), (0, 2))
+        # the cheap model isn't loaded anywhere, so the less busy host gets it
+        pool.generate('general-phi3:123', 'prompt')
+        self.assertEqual((first.generated, second.generated), (1, 2))
+        self.assertEqual(pool.hosts[0].models, {'phi3:14b'})
+
+    def test_probe_maps_loaded_models_to_their_base(self):
+        stub = self.stub()
+        pool = self.pool([stub.url], probe_interval=0.05)
+        pool.create('summarizer:abc', 'FROM llama3.1:70b')
+        stub.loaded = {'summarizer:abc', 'gemma2:27b'}
+        time.sleep(0.3)
+        self.assertEqual(pool.hosts[0].models, {'llama3.1:70b', 'gemma2:27b'})
+
+    def test_create_reaches_every_host_and_list_only_shows_models_on_all(self):
+        (first, second) = (self.stub(), self.stub())
+        pool = self.pool([first.url, second.url])
+        pool.create('general:abc', 'FROM llama3.1:70b')
+        second.models.add('only-here:1')
+        self.assertEqual(first.models, {'general:abc'})
+        self.assertEqual(pool.list(), {'models': [{'name': 'general:abc'}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from typing import Any, Optional
+
+from router import CascadeRouter, Label, Percentage, RoutingStats
+
+LEVELS = ('High', 'Medium', 'Low')
+
+
+class LabelTest(unittest.TestCase):
+    def test_parse(self):
+        label = Label(LEVELS)
+        for (answer, expected) in [
+            ('High', 'High'),
+            ('  "medium".', 'Medium'),
+            ('**Low**', 'Low'),
+            ('Answer: High', 'High'),
+            ('Medium-High', None),
+            ('Low to Medium', None),
+            ('High\nThe technology has changed how millions of people live and work.', 'High'),
+            ('The technology has had a high impact on how millions of people live and work today.', None),
+        ]:
+            with self.subTest(answer=answer):
+                self.assertEqual(label.parse(answer), expected)
+
+    def test_final_only_once_nothing_can_follow(self):
+        label = Label(LEVELS)
+        for (answer, expected) in [
+            ('Medium', None),
+            ('Medium-', None),
+            ('Low to', None),
+            ('Low', None),
+            ('High.', None),
+            ('High\n', 'High'),
+            ('High. ', 'High'),
+            ('"Low"\n', 'Low'),
+            ('Medium-High\n', None),
+        ]:
+            with self.subTest(answer=answer):
+                self.assertEqual(label.final(answer), expected)
+
+    def test_longer_label_is_not_cut_at_a_shorter_one(self):
+        label = Label(('quantity of life', 'quality of life', 'both', 'neither'))
+        self.assertIsNone(label.final('quality'))
+        self.assertEqual(label.final('quality of life\n'), 'quality of life')
+
+
+class PercentageTest(unittest.TestCase):
+    def test_parse(self):
+        percentage = Percentage()
+        for (answer, expected) in [
+            ('0.5%', '0.5%'),
+            ('−1.2 %', '-1.2%'),
+            ('About 2%.', '2%'),
+            ('Between 1% and 3%', None),
+            ('0.5%\nThis reflects a modest but real contribution to social progress.', '0.5%'),
+        ]:
+            with self.subTest(answer=answer):
+                self.assertEqual(percentage.parse(answer), expected)
+
+    def test_final(self):
+        percentage = Percentage()
+        self.assertIsNone(percentage.final('0.5'))
+        self.assertIsNone(percentage.final('0.5%'))
+        self.assertIsNone(percentage.final('1% to'))
+        self.assertEqual(percentage.final('0.5%\n'), '0.5%')
+
+
+class FakeAgent:
+    def __init__(self, answer: str):
+        self.answer = answer
+        self.calls = 0
+        self.modelfile = ''
+
+    def run(self, prompt: str, parser: Optional[Any] = None) -> str:
+        self.calls += 1
+        return self.answer
+
+
+class CascadeRouterTest(unittest.TestCase):
+    def route(self, *answers: str) -> tuple[str, FakeAgent]:
+        strong = FakeAgent('Low')
+        router = CascadeRouter('level', [FakeAgent(answer) for answer in answers], strong, Label(LEVELS), RoutingStats())
+        return (router.run('prompt'), strong)
+
+    def test_agreeing_cheap_answers_are_accepted(self):
+        for answers in [('High', 'High'), ('High', 'high.'), ('High\nIt changed how people live.', 'High')]:
+            with self.subTest(answers=answers):
+                (answer, strong) = self.route(*answers)
+                self.assertEqual((answer, strong.calls), ('High', 0))
+
+    def test_hedged_or_disagreeing_answers_escalate(self):
+        for answers in [('Medium-High', 'Medium-High'), ('Low to Medium', 'Low'), ('High', 'Medium')]:
+            with self.subTest(answers=answers):
+                (answer, strong) = self.route(*answers)
+                self.assertEqual((answer, strong.calls), ('Low', 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import unittest
+from graphlib import CycleError
+from types import SimpleNamespace
+from typing import Any, Optional
+
+from scheduler import FingerprintStore, Pipeline, Scheduler, Stage
+
+
+class SchedulerTest(unittest.TestCase):
+    # two stages: `upper` reads `text`, `length` reads what `upper` wrote
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'fingerprints.sqlite')
+        self.fingerprints = FingerprintStore(self.path)
+        self.ran: list[tuple[str, str]] = []
+        self.failing: set[str] = set()
+
+    def tearDown(self):
+        self.fingerprints.close()
+        self.directory.cleanup()
+
+    def pipeline(self, salt: str = '') -> Pipeline:
+        def upper(subject: Any) -> dict[str, Any]:
+            if subject.text in self.failing:
+                raise ValueError(f'cannot upper {subject.text}')
+            return {'upper': subject.text.upper()}
+
+        return Pipeline([
+            Stage('upper', ('text',), ('upper',), upper, salt),
+            Stage('length', ('upper',), ('length',), lambda subject: {'length': len(subject.upper)}),
+        ])
+
+    def run_pipeline(self, subjects: dict[str, Any], pipeline: Optional[Pipeline] = None) -> Scheduler:
+        self.ran.clear()
+        scheduler = Scheduler(self.fingerprints)
+        scheduler.run(subjects, pipeline or self.pipeline(), lambda key, stage, fields: self.ran.append((key, stage)))
+        return scheduler
+
+    def test_missing_outputs_run_and_a_rerun_does_nothing(self):
+        subjects = {'a': SimpleNamespace(text='ab', upper=None, length=None)}
+        self.run_pipeline(subjects)
+        self.assertEqual(self.ran, [('a', 'upper'), ('a', 'length')])
+        self.assertEqual((subjects['a'].upper, subjects['a'].length), ('AB', 2))
+        self.run_pipeline(subjects)
+        self.assertEqual(self.ran, [])
+
+    def test_changed_input_reruns_the_stage_and_everything_downstream(self):
+        subjects = {'a': SimpleNamespace(text='ab', upper=None, length=None)}
+        self.run_pipeline(subjects)
+        subjects['a'].text = 'abc'
+        self.run_pipeline(subjects)
+        self.assertEqual(self.ran, [('a', 'upper'), ('a', 'length')])
+        self.assertEqual(subjects['a'].length, 3)
+
+    def test_changed_salt_is_a_fingerprint_mismatch(self):
+        subjects = {'a': SimpleNamespace(text='ab', upper=None, length=None)}
+        self.run_pipeline(subjects)
+        self.run_pipeline(subjects, self.pipeline(salt='new modelfile'))
+        self.assertEqual(self.ran, [('a', 'upper'), ('a', 'length')])
+
+    def test_only_the_missing_downstream_output_runs(self):
+        subjects = {'a': SimpleNamespace(text='ab', upper=None, length=None)}
+        self.run_pipeline(subjects)
+        subjects['a'].length = None
+        self.run_pipeline(subjects)
+        self.assertEqual(self.ran, [('a', 'length')])
+
+    def test_outputs_without_fingerprints_are_adopted(self):
+        subjects = {'a': SimpleNamespace(text='ab', upper='AB', length=2)}
+        self.run_pipeline(subjects)
+        self.assertEqual(self.ran, [])
+        self.assertIsNotNone(self.fingerprints.get('a', 'upper'))
+        subjects['a'].text = 'abc'
+        self.run_pipeline(subjects)
+        self.assertEqual(self.ran, [('a', 'upper'), ('a', 'length')])
+
+    def test_failed_stage_skips_its_dependents_and_is_retried(self):
+        subjects = {'a': SimpleNamespace(text='ab', upper=None, length=None), 'b': SimpleNamespace(text='cd', upper=None, length=None)}
+        self.failing = {'ab'}
+        scheduler = self.run_pipeline(subjects)
+        self.assertEqual(sorted(self.ran), [('b', 'length'), ('b', 'upper')])
+        self.assertEqual([(key, stage) for key, stage, _ in scheduler.failures], [('a', 'upper'), ('a', 'length')])
+        self.assertIsNone(self.fingerprints.get('a', 'upper'))
+        self.failing = set()
+        self.assertEqual(self.run_pipeline(subjects).failures, [])
+        self.assertEqual(self.ran, [('a', 'upper'), ('a', 'length')])
+
+    def test_cycles_are_rejected(self):
+        with self.assertRaises(CycleError):
+            Pipeline([Stage('a', ('y',), ('x',), lambda subject: {}), Stage('b', ('x',), ('y',), lambda subject: {})])
+
+
+class FingerprintStoreTest(unittest.TestCase):
+    def test_persists_and_imports_the_legacy_json_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            legacy = os.path.join(directory, 'fingerprints.json')
+            with open(legacy, 'w') as file:
+                json.dump({'a': {'upper': 'f1', 'length': 'f2'}}, file)
+            path = os.path.join(directory, 'fingerprints.sqlite')
+            store = FingerprintStore(path, legacy=legacy)
+            self.assertEqual(store.get('a', 'length'), 'f2')
+            store.set('a', ('upper',), 'f3')
+            store.close()
+
+            store = FingerprintStore(path, legacy=legacy)
+            self.assertEqual((store.get('a', 'upper'), store.get('a', 'length'), store.get('b', 'upper')), ('f3', 'f2', None))
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
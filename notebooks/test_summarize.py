@@ -0,0 +1,86 @@
+import json
+import unittest
+from typing import Any
+
+from model import Technology, parse_sections, summarize
+
+SECTIONS = {
+    'summary': 'Brain-machine interfaces let people control devices with their thoughts.',
+    'impact': 'They could restore movement to paralysed patients.',
+    'author': 'Jane Doe',
+    'opinion': 'The author is cautiously optimistic.',
+}
+
+
+class FakeAgent:
+    # answers run() with `text` and run_json() by parsing `json_text`, the way Agent.run_json does
+    def __init__(self, text: str = '', json_text: str = ''):
+        self.text = text
+        self.json_text = json_text
+        self.calls = 0
+
+    def run(self, prompt: str, parser: Any = None) -> str:
+        self.calls += 1
+        return self.text
+
+    def run_json(self, prompt: str) -> Any:
+        self.calls += 1
+        return json.loads(self.json_text)
+
+
+def labelled(template: str = '{label}: {body}', **overrides: str) -> str:
+    sections = {**SECTIONS, **overrides}
+    return '\n'.join(template.format(label=section.upper(), body=body) for section, body in sections.items())
+
+
+class ParseSectionsTest(unittest.TestCase):
+    def test_plain_labels(self):
+        self.assertEqual(parse_sections(labelled()), SECTIONS)
+
+    def test_markdown_bold_labels(self):
+        self.assertEqual(parse_sections(labelled('**{label}:** {body}')), SECTIONS)
+        self.assertEqual(parse_sections(labelled('**{label}**: {body}')), SECTIONS)
+        self.assertEqual(parse_sections(labelled('## {label}:\n{body}\n')), SECTIONS)
+
+    def test_quoted_output(self):
+        self.assertEqual(parse_sections(f'"{labelled()}"'), SECTIONS)
+        self.assertEqual(parse_sections(labelled('"{label}: {body}"')), SECTIONS)
+
+    def test_duplicate_label_keeps_the_first(self):
+        text = labelled() + '\nSUMMARY: A second summary the model added at the end.'
+        self.assertEqual(parse_sections(text), SECTIONS)
+
+    def test_label_words_inside_a_section_are_not_labels(self):
+        text = labelled(opinion='The summary: a cautious but optimistic piece.')
+        self.assertEqual(parse_sections(text)['opinion'], 'The summary: a cautious but optimistic piece.')
+
+    def test_empty_or_missing_section(self):
+        self.assertIsNone(parse_sections(labelled(author='')))
+        self.assertIsNone(parse_sections('\n'.join(f'{section.upper()}: {body}' for section, body in SECTIONS.items() if section != 'impact')))
+        self.assertIsNone(parse_sections('Just a paragraph about the technology.'))
+
+
+class SummarizeTest(unittest.TestCase):
+    technology = Technology({'name': 'Brain-Machine Interfaces', 'year': 2001, 'tr_text': 'article'})
+
+    def test_well_formed_summary_needs_no_cleaner(self):
+        cleaner = FakeAgent()
+        result = summarize(self.technology, FakeAgent(labelled('**{label}:** {body}')), cleaner)
+        self.assertEqual(result, tuple(SECTIONS.values()))
+        self.assertEqual(cleaner.calls, 0)
+
+    def test_empty_section_falls_back_to_one_cleaner_call(self):
+        cleaner = FakeAgent(json_text=json.dumps(SECTIONS))
+        result = summarize(self.technology, FakeAgent(labelled(author='')), cleaner)
+        self.assertEqual(result, tuple(SECTIONS.values()))
+        self.assertEqual(cleaner.calls, 1)
+
+    def test_cleaner_errors_are_value_errors(self):
+        for json_text in ['{"summary": "a", "impact": "b"', '["a", "b", "c", "d"]', '3', json.dumps({**SECTIONS, 'author': None}), json.dumps({key: value for key, value in SECTIONS.items() if key != 'opinion'})]:
+            with self.subTest(json_text=json_text):
+                with self.assertRaisesRegex(ValueError, 'the summary of Brain-Machine Interfaces'):
+                    summarize(self.technology, FakeAgent('no sections here'), FakeAgent(json_text=json_text))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import threading
+import unittest
+from typing import Any
+
+from writeback import WriteBehindTable
+
+
+class FakeTable:
+    # records every batch_update; `failures` requests in a row fail before the table starts accepting again
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.batches: list[list[dict[str, Any]]] = []
+        self._lock = threading.Lock()
+
+    def batch_update(self, records: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        with self._lock:
+            if len(records) > 10:
+                raise ValueError('airtable accepts at most 10 records per request')
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError('429 Too Many Requests')
+            self.batches.append(records)
+        return records
+
+
+class WriteBehindTableTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal = os.path.join(self.directory.name, 'journal.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def writer(self, table: FakeTable) -> WriteBehindTable:
+        return WriteBehindTable(table, self.journal, rate=1000, flush_interval=3600)
+
+    def test_batches_of_at_most_ten(self):
+        table = FakeTable()
+        writer = self.writer(table)
+        for number in range(28):
+            writer.update(f'rec{number}', {'summary': str(number)})
+        writer.close()
+        self.assertEqual([len(batch) for batch in table.batches], [10, 10, 8])
+        self.assertEqual(writer.requests, 3)
+
+    def test_updates_to_one_record_are_merged(self):
+        table = FakeTable()
+        writer = self.writer(table)
+        writer.update('rec1', {'summary': 'a'})
+        writer.update('rec1', {'impact': 'b'})
+        writer.update('rec1', {'summary': 'c'})
+        writer.close()
+        self.assertEqual(table.batches, [[{'id': 'rec1', 'fields': {'summary': 'c', 'impact': 'b'}}]])
+
+    def test_failed_full_batch_does_not_fail_the_update(self):
+        table = FakeTable(failures=1)
+        writer = self.writer(table)
+        for number in range(10):
+            writer.update(f'rec{number}', {'summary': str(number)})
+        self.assertEqual(len(writer.pending()), 10)
+        writer.close()
+        self.assertEqual([len(batch) for batch in table.batches], [10])
+        self.assertEqual(writer.pending(), {})
+
+    def test_unflushed_updates_survive_a_restart(self):
+        writer = self.writer(FakeTable(failures=100))
+        writer.update('rec1', {'summary': 'a'})
+        writer.update('rec2', {'summary': 'b'})
+        writer.close()
+
+        table = FakeTable()
+        writer = self.writer(table)
+        self.assertEqual(writer.pending(), {'rec1': {'summary': 'a'}, 'rec2': {'summary': 'b'}})
+        writer.close()
+        self.assertEqual(len(table.batches[0]), 2)
+
+    def test_journal_is_compacted_after_a_flush(self):
+        writer = self.writer(FakeTable())
+        writer.update('rec1', {'summary': 'a'})
+        writer.flush()
+        with open(self.journal) as file:
+            self.assertEqual(file.read(), '')
+        writer.close()
+
+    def test_torn_last_journal_line_is_ignored(self):
+        with open(self.journal, 'w') as file:
+            file.write('{"id": "rec1", "fields": {"summary": "a"}}\n{"id": "rec2", "fie')
+        writer = self.writer(FakeTable(failures=100))
+        self.assertEqual(writer.pending(), {'rec1': {'summary': 'a'}})
+        # appended after the torn line, then a crash before anything reached airtable
+        writer.update('rec3', {'summary': 'c'})
+        writer._closed.set()
+        writer._journal.close()
+
+        writer = self.writer(FakeTable())
+        self.assertEqual(writer.pending(), {'rec1': {'summary': 'a'}, 'rec3': {'summary': 'c'}})
+        writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+import time
+from typing import Any
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class WriteBehindTable:
+    # merges field updates per record and sends them with batch_update, at most `batch_size` records per request
+    # (airtable's limit) and `rate` requests per second; every update is journaled before it is acknowledged so
+    # anything not yet flushed survives a crash and is picked up again on the next start
+    def __init__(self, table: Any, journal: str, batch_size: int = 10, rate: float = 5, flush_interval: float = 5):
+        self.table = table
+        self.journal = journal
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(rate, capacity=int(rate))
+        self.requests = 0
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        replayed = os.path.exists(journal)
+        if replayed:
+            with open(journal) as file:
+                for line in file:
+                    # a torn last line from a crash mid-write is the only thing that can fail to parse
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._pending.setdefault(entry['id'], {}).update(entry['fields'])
+        self._journal = open(journal, 'a')
+        if replayed:
+            # rewritten from what was replayed, so nothing is appended to a torn line and lost with it next time
+            self._compact()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, args=(flush_interval,), daemon=True, name='writeback')
+        self._flusher.start()
+
+    def pending(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {record_id: dict(fields) for record_id, fields in self._pending.items()}
+
+    def update(self, record_id: str, fields: dict[str, Any]):
+        with self._lock:
+            self._journal.write(json.dumps({'id': record_id, 'fields': fields}) + '\n')
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._pending.setdefault(record_id, {}).update(fields)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            # the update is already journaled, so a failed request mustn't fail the caller; it is retried later
+            try:
+                self.flush(full_batches_only=True)
+            except Exception as error:
+                print('airtable flush failed:', error)
+
+    def flush(self, full_batches_only: bool = False):
+        with self._flushing:
+            while True:
+                with self._lock:
+                    if not self._pending or (full_batches_only and len(self._pending) < self.batch_size):
+                        return
+                    batch = [(record_id, self._pending.pop(record_id)) for record_id in list(self._pending)[:self.batch_size]]
+                self.bucket.acquire()
+                try:
+                    self.table.batch_update([{'id': record_id, 'fields': fields} for record_id, fields in batch])
+                except Exception:
+                    with self._lock:
+                        for record_id, fields in batch:
+                            # anything written to the record since the batch was taken is newer and wins
+                            self._pending[record_id] = {**fields, **self._pending.get(record_id, {})}
+                    raise
+                self.requests += 1
+                self._compact()
+
+    def close(self):
+        self._closed.set()
+        self._flusher.join()
+        try:
+            self.flush()
+        except Exception as error:
+            print(f'airtable flush failed, {len(self.pending())} records left in {self.journal} for the next run:', error)
+        finally:
+            with self._lock:
+                self._journal.close()
+
+    def _compact(self):
+        # rewrite the journal to hold only what is still pending
+        with self._lock:
+            tmp = f'{self.journal}.tmp'
+            with open(tmp, 'w') as file:
+                for record_id, fields in self._pending.items():
+                    file.write(json.dumps({'id': record_id, 'fields': fields}) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            self._journal.close()
+            os.replace(tmp, self.journal)
+            self._journal = open(self.journal, 'a')
+
+    def _flush_periodically(self, interval: float):
+        while not self._closed.wait(interval):
+            try:
+                self.flush()
+            except Exception as error:
+                # left pending and journaled; the next tick or close() retries
+                print('airtable flush failed:', error)